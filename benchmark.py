@@ -0,0 +1,225 @@
+from argparse import ArgumentParser
+from tempfile import TemporaryDirectory
+from time import perf_counter
+import os.path
+
+from flask import Flask, Response, session, jsonify
+
+
+def timeit(fn, n: int) -> float:
+    start = perf_counter()
+    for _ in range(n):
+        fn()
+    return (perf_counter() - start) / n
+
+
+def report(name: str, seconds: float) -> None:
+    print(f'{name:<16}{seconds * 1e6:>10.1f} us/req{1 / seconds:>12.0f} req/s')
+
+
+def bench_session(args) -> None:
+    from zvms.session import init_session
+
+    with TemporaryDirectory() as instance:
+        for store in ('cookie', 'memory', 'sqlite'):
+            app = Flask('benchmark', instance_path=instance)
+            app.config.update(
+                SECRET_KEY='benchmark',
+                SESSION_STORE=store,
+                SESSION_STORE_PATH=f'sessions-{store}.db',
+                SESSION_STORE_CAPACITY=args.requests,
+                SESSION_SWEEP_INTERVAL=600
+            )
+            init_session(app)
+
+            @app.route('/login')
+            def login():
+                session.update(
+                    userid=20220101,
+                    username='张三',
+                    permission=0,
+                    classid=202201
+                )
+                return ''
+
+            @app.route('/')
+            def index():
+                return str(session.get('userid'))
+
+            client = app.test_client()
+            client.get('/login')
+            report(store, timeit(lambda: client.get('/'), args.requests))
+            report(store + ' login', timeit(
+                lambda: client.get('/login'), args.requests // 10))
+            if store == 'sqlite':
+                print('sqlite file size:', os.path.getsize(
+                    os.path.join(instance, 'sessions-sqlite.db')))
+
+
+def sample_pages(rows: int) -> dict[str, str | list]:
+    html = ''.join(
+        f'<tr><td>{i}</td><td><a href="/volunteer/{i}">第{i}次校内义工活动</a></td>'
+        f'<td>2023-10-{i % 28 + 1:02}</td><td><span class="badge text-bg-success">已审核</span></td></tr>'
+        for i in range(rows)
+    )
+    return {
+        'html': f'<table class="table table-hover">{html}</table>',
+        'json': [
+            {
+                'id': i,
+                'title': f'通知{i}',
+                'content': '请各班义工委员于本周五前提交感想',
+                'sender': 20220201,
+                'expire': '2023-10-31'
+            }
+            for i in range(rows)
+        ],
+        'csv': ''.join(f'2022{i:04},学生{i},高一{i % 12 + 1}班,{i % 7}.5,3.0,0.0,{i % 7 + 3}.5\r\n' for i in range(rows))
+    }
+
+
+def bench_compress(args) -> None:
+    from zvms.compress import init_compress, brotli
+
+    pages = sample_pages(args.rows)
+    settings = [('identity', 6, 4)]
+    settings += [(f'gzip-{level}', level, 4) for level in (1, 6, 9)]
+    if brotli is not None:
+        settings += [(f'br-{quality}', 6, quality) for quality in (4, 11)]
+    else:
+        print('`brotli` not found, skipping br.')
+    for name, level, quality in settings:
+        app = Flask('benchmark')
+        app.config.update(
+            COMPRESS_LEVEL=level,
+            COMPRESS_BROTLI_QUALITY=quality,
+            COMPRESS_MIN_SIZE=args.min_size
+        )
+        init_compress(app)
+        app.add_url_rule('/html', 'html', lambda: pages['html'])
+        app.add_url_rule('/json', 'json', lambda: jsonify(pages['json']))
+        app.add_url_rule('/csv', 'csv', lambda: Response(
+            (pages['csv'][i:i + 16384] for i in range(0, len(pages['csv']), 16384)),
+            mimetype='text/csv'
+        ))
+        client = app.test_client()
+        encoding = name.split('-')[0]
+        for page in pages:
+            size = len(client.get(f'/{page}', headers={'Accept-Encoding': encoding}).data)
+            seconds = timeit(
+                lambda: client.get(f'/{page}', headers={'Accept-Encoding': encoding}),
+                args.requests
+            )
+            # 服务端耗时加上在给定带宽下的传输时间
+            transfer = size * 8 / (args.bandwidth * 1e6)
+            print(f'{name + " " + page:<16}{size:>10} B{seconds * 1e3:>10.2f} ms'
+                  f'{(seconds + transfer) * 1e3:>10.2f} ms @ {args.bandwidth} Mbps')
+
+
+def bench_templates(args) -> None:
+    from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+
+    loader = FileSystemLoader(os.path.join(os.path.dirname(__file__), 'zvms', 'templates'))
+    with TemporaryDirectory() as directory:
+        for name, cache in (
+            ('no cache', None),
+            ('cache (cold)', FileSystemBytecodeCache(directory)),
+            ('cache (warm)', FileSystemBytecodeCache(directory))
+        ):
+            # 每次都是新的Environment, 相当于新启动的进程
+            env = Environment(loader=loader, bytecode_cache=cache)
+            names = env.list_templates(extensions=['html'])
+            start = perf_counter()
+            for template in names:
+                env.get_template(template)
+            print(f'{name:<16}{len(names):>4} templates{(perf_counter() - start) * 1e3:>10.1f} ms')
+
+
+def bench_sse(args) -> None:
+    import asyncio
+    import resource
+
+    from tornado.web import Application
+    from tornado.netutil import bind_sockets
+    from tornado.httpserver import HTTPServer
+
+    from zvms.handlers import EventsHandler
+    from zvms.pubsub import broker
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    async def connect(port: int, received: asyncio.Queue) -> asyncio.StreamWriter:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET /events HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        await writer.drain()
+        await reader.readuntil(b'\r\n\r\n')
+
+        async def read():
+            while line := await reader.readline():
+                if line.startswith(b'event:'):
+                    received.put_nowait(perf_counter())
+        asyncio.create_task(read())
+        return writer
+
+    async def run() -> None:
+        # 不经过会话, 所有连接都订阅school
+        app = Application([
+            (r'/events', EventsHandler, {'topics': lambda request: ['school']})
+        ])
+        sockets = bind_sockets(0, '127.0.0.1')
+        port = sockets[0].getsockname()[1]
+        HTTPServer(app).add_sockets(sockets)
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        received = asyncio.Queue()
+        start = perf_counter()
+        writers = [await connect(port, received) for _ in range(args.connections)]
+        connected = perf_counter() - start
+        grown = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+        print(f'{args.connections} connections in {connected * 1e3:.0f} ms, '
+              f'{connected / args.connections * 1e6:.0f} us/conn, '
+              f'+{grown / 1024:.1f} MiB RSS (client and server)')
+        for _ in range(args.rounds):
+            published = perf_counter()
+            broker.publish('school', 'notice', {'title': 'benchmark'})
+            for _ in range(args.connections):
+                last = await received.get()
+            print(f'publish -> {args.connections} received{(last - published) * 1e3:>10.2f} ms')
+        for writer in writers:
+            writer.close()
+        # 等服务端的连接处理完关闭
+        while broker.topics:
+            await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+
+
+def main() -> None:
+    parser = ArgumentParser()
+    subparsers = parser.add_subparsers(required=True)
+
+    session_parser = subparsers.add_parser('session', help='比较cookie会话和服务端会话存储')
+    session_parser.add_argument('-n', '--requests', type=int, default=5000)
+    session_parser.set_defaults(fn=bench_session)
+
+    compress_parser = subparsers.add_parser('compress', help='比较不同压缩算法和级别的体积与耗时')
+    compress_parser.add_argument('-n', '--requests', type=int, default=200)
+    compress_parser.add_argument('-r', '--rows', type=int, default=500, help='列表页的行数')
+    compress_parser.add_argument('-b', '--bandwidth', type=float, default=10, help='带宽(Mbps)')
+    compress_parser.add_argument('--min-size', type=int, default=1024)
+    compress_parser.set_defaults(fn=bench_compress)
+
+    templates_parser = subparsers.add_parser('templates', help='比较有无字节码缓存时编译全部模板的耗时')
+    templates_parser.set_defaults(fn=bench_templates)
+
+    sse_parser = subparsers.add_parser('sse', help='测试大量空闲SSE连接的开销和推送延迟')
+    sse_parser.add_argument('-c', '--connections', type=int, default=1000)
+    sse_parser.add_argument('-r', '--rounds', type=int, default=5)
+    sse_parser.set_defaults(fn=bench_sse)
+
+    args = parser.parse_args()
+    args.fn(args)
+
+
+if __name__ == '__main__':
+    main()
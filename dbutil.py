@@ -0,0 +1,22 @@
+"""import.py和migrate.py共用的函数, 直接使用sqlite3, 不导入zvms"""
+from typing import Iterable, Iterator
+from itertools import islice
+import sqlite3
+
+
+def bump_generations(cursor: sqlite3.Cursor, *names: str) -> None:
+    """让运行中的服务丢弃相关的缓存, 见zvms/cache.py"""
+    cursor.executemany(
+        'INSERT OR IGNORE INTO generation(name, value) VALUES(?, 0)',
+        [(name,) for name in names]
+    )
+    cursor.executemany(
+        'UPDATE generation SET value = value + 1 WHERE name = ?',
+        [(name,) for name in names]
+    )
+
+
+def batches(n: int, iterable: Iterable) -> Iterator[list]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, n)):
+        yield batch
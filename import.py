@@ -1,12 +1,17 @@
 from argparse import ArgumentParser
-from operator import itemgetter
-from itertools import groupby
+from collections import defaultdict
+from typing import Iterable, Iterator
+from html import escape
 
 import sqlite3
 import hashlib
-import random
+import secrets
+import time
+import sys
 import csv
 
+from dbutil import bump_generations, batches
+
 
 def md5ify(bytes: bytes) -> str:
     md5 = hashlib.md5()
@@ -14,44 +19,325 @@ def md5ify(bytes: bytes) -> str:
     return md5.hexdigest()
 
 
-def generate_password(length: int) -> str:
-    return md5ify(random.randbytes(8))[:length]
+def generate_passwords(n: int, length: int) -> list[str]:
+    nbytes = (length + 1) // 2
+    return [secrets.token_hex(nbytes)[:length] for _ in range(n)]
+
+
+def read_csv(path: str) -> Iterator[tuple[int, list[str]]]:
+    """逐行读取csv, 跳过表头和空行, 产生(行号, 行)"""
+    with open(path, encoding='utf-8', newline='') as file:
+        reader = csv.reader(file, skipinitialspace=True)
+        next(reader, None)
+        for row in reader:
+            if row:
+                yield reader.line_num, row
+
+
+class Checker:
+    """在内存中检查唯一性和班级是否存在, 记录所有错误而不是遇到第一个就退出"""
+
+    def __init__(self, cursor: sqlite3.Cursor) -> None:
+        self.class_names = dict(cursor.execute('SELECT id, name FROM class'))
+        self.userids = {id for id, in cursor.execute('SELECT userid FROM user')}
+        self.usernames = {
+            name for name, in cursor.execute('SELECT username FROM user')}
+        self.errors: list[str] = []
 
+    def error(self, where: str, msg: str) -> None:
+        self.errors.append(f'{where}: {msg}')
 
-def chunks(n, iterable):
-    iterator = iter(iterable)
-    while True:
-        ret = []
-        try:
-            for _ in range(n):
-                ret.append(next(iterator))
-            yield ret
-        except StopIteration:
-            yield ret
-            return
+    def rows(self, path: str, columns: int) -> Iterator[tuple[str, list[str]]]:
+        for line, row in read_csv(path):
+            where = f'{path}:{line}'
+            if len(row) == columns:
+                yield where, row
+            else:
+                self.error(where, f'应有{columns}列, 实际为{len(row)}列')
 
+    def integer(self, where: str, value: str) -> int | None:
+        if value.isdecimal():
+            return int(value)
+        self.error(where, f'{value!r}不是数字')
 
-def generate_html(users, classes) -> str:
-    return '<html><body>{}</body></html>'.format(
-        ''.join(
-            generate_class_table(classes[classid], members)
-            for classid, members in groupby(users, key=itemgetter(3))
+    def classes(self, path: str) -> Iterator[tuple[int, str]]:
+        for where, (id, name) in self.rows(path, 2):
+            if (id := self.integer(where, id)) is None:
+                continue
+            if id in self.class_names:
+                self.error(where, f'班级{id}已存在')
+                continue
+            self.class_names[id] = name
+            yield id, name
+
+    def users(self, path: str) -> Iterator[tuple[int, str, int]]:
+        for where, (id, name, cls) in self.rows(path, 3):
+            id, cls = self.integer(where, id), self.integer(where, cls)
+            if id is None or cls is None:
+                continue
+            if id in self.userids:
+                self.error(where, f'用户{id}已存在')
+            elif name in self.usernames:
+                self.error(where, f'用户名{name}已存在')
+            elif cls not in self.class_names:
+                self.error(where, f'班级{cls}不存在')
+            else:
+                self.userids.add(id)
+                self.usernames.add(name)
+                yield id, name, cls
+
+
+class Progress:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.count = 0
+        self.start = time.perf_counter()
+
+    def __call__(self, n: int) -> None:
+        self.count += n
+        elapsed = time.perf_counter() - self.start
+        print(
+            f'\r{self.name}: {self.count}行, {self.count / max(elapsed, 1e-6):.0f}行/秒',
+            end='',
+            file=sys.stderr,
+            flush=True
         )
-    )
+
+    def done(self) -> None:
+        self(0)
+        print(file=sys.stderr)
 
 
-def generate_class_table(classname, memebrs) -> str:
-    return f'<h2>{classname}</h2><table>{{}}</table>'.format(
-        ''.join(
-            '<tr>{}</tr>'.format(
-                ''.join(
-                    f'<td>{userid}</td><td>{username}</td><td>{password}</td>'
-                    for userid, username, password, _ in chunk
-                )
+def relax_pragmas(connection: sqlite3.Connection) -> None:
+    """
+    只对本连接有效. 导入在一个事务中进行, 失败时整体回滚;
+    不等待fsync, 断电时可能需要重新导入
+    """
+    connection.execute('PRAGMA synchronous = OFF')
+    connection.execute('PRAGMA temp_store = MEMORY')
+    connection.execute('PRAGMA cache_size = -65536')
+
+
+PAGE_HEAD = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>初始密码</title>
+<style>
+table { border-collapse: collapse; }
+td { border: 1px solid #888; padding: 4px 8px; font-family: monospace; }
+section + section { break-before: page; }
+</style>
+</head>
+<body>
+"""
+
+
+def group_by_class(
+    users: Iterable[tuple[int, str, str, int]]
+) -> dict[int, list[tuple[int, str, str, int]]]:
+    """一次遍历按班级分组, 不要求输入有序; 班级内保持原来的顺序"""
+    groups = defaultdict(list)
+    for user in users:
+        groups[user[3]].append(user)
+    return dict(sorted(groups.items()))
+
+
+def write_html(path: str, groups: dict[int, list], class_names: dict[int, str]) -> None:
+    """每个班级一页, 每行三个用户, 边生成边写入"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(PAGE_HEAD)
+        for classid, members in groups.items():
+            f.write(f'<section><h2>{escape(class_names[classid])}</h2><table>\n')
+            for row in batches(3, members):
+                f.write('<tr>')
+                for userid, username, password, _ in row:
+                    f.write(f'<td>{userid}</td><td>{escape(username)}</td><td>{password}</td>')
+                f.write('</tr>\n')
+            f.write('</table></section>\n')
+        f.write('</body></html>\n')
+
+
+def write_csv(path: str, groups: dict[int, list], class_names: dict[int, str]) -> None:
+    # 带BOM, 便于用Excel打开后打印或邮件合并
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(('班级', 'ID', '用户名', '密码'))
+        for classid, members in groups.items():
+            writer.writerows(
+                (class_names[classid], userid, username, password)
+                for userid, username, password, _ in members
             )
-            for chunk in chunks(3, memebrs)
-        )
-    )
+
+
+def create_users(
+    cursor: sqlite3.Cursor,
+    batch: list[tuple[int, str, int]],
+    length: int,
+    sql: str = 'INSERT INTO user(userid, username, password, permission, classid) '
+               'VALUES(?, ?, ?, 0, ?)'
+) -> list[tuple[int, str, str, int]]:
+    """插入新用户, 返回(ID, 用户名, 初始密码, 班级)"""
+    passwords = generate_passwords(len(batch), length)
+    cursor.executemany(sql, [
+        (id, name, md5ify(pwd.encode()), cls)
+        for (id, name, cls), pwd in zip(batch, passwords)
+    ])
+    return [
+        (id, name, pwd, cls)
+        for (id, name, cls), pwd in zip(batch, passwords)
+    ]
+
+
+def insert_all(cursor: sqlite3.Cursor, checker: Checker, args) -> tuple[list, set, str]:
+    progress = Progress('班级')
+    for batch in batches(args.batch_size, checker.classes(args.classes)):
+        cursor.executemany('INSERT INTO class(id, name) VALUES(?, ?)', batch)
+        progress(len(batch))
+    progress.done()
+
+    users = []
+    progress = Progress('用户')
+    for batch in batches(args.batch_size, checker.users(args.users)):
+        users.extend(create_users(cursor, batch, args.password_length))
+        progress(len(batch))
+    progress.done()
+    return users, set(), f'{len(users)}个用户'
+
+
+CLASS_UPSERT = (
+    'INSERT INTO class(id, name) VALUES(?, ?) '
+    'ON CONFLICT(id) DO UPDATE SET name = excluded.name'
+)
+# 已有用户只更新用户名和班级, 保留密码和权限
+USER_UPSERT = (
+    'INSERT INTO user(userid, username, password, permission, classid) '
+    'VALUES(?, ?, ?, 0, ?) '
+    'ON CONFLICT(userid) DO UPDATE SET '
+    'username = excluded.username, classid = excluded.classid'
+)
+# 删除用户时, 参与记录, 图片(触发器减少引用计数)和收到的通知一并删除,
+# 创建的义工, 发送的通知和反馈转给系统用户
+REMOVE_USER = [
+    'DELETE FROM user_vol WHERE userid = ?',
+    'DELETE FROM picture WHERE userid = ?',
+    'DELETE FROM user_notice WHERE userid = ?',
+    'DELETE FROM user_notice_archive WHERE userid = ?',
+    'DELETE FROM notice_outbox WHERE target = ? AND NOT class_notice',
+    'UPDATE volunteer SET holder = 0 WHERE holder = ?',
+    'UPDATE notice SET sender = 0 WHERE sender = ?',
+    'UPDATE notice_archive SET sender = 0 WHERE sender = ?',
+    'UPDATE issue SET author = 0 WHERE author = ?',
+    'DELETE FROM user WHERE userid = ?'
+]
+
+
+def revoke_sessions(path: str, userids: set[int]) -> None:
+    """
+    删除服务端的会话(SESSION_STORE = 'sqlite'时), 让用户重新登录.
+    会话中保存了用户名和班级, 被删除, 转班和改名的用户都需要
+    """
+    try:
+        connection = sqlite3.connect(f'file:{path}?mode=rw', uri=True)
+    except sqlite3.OperationalError:
+        return
+    with connection:
+        connection.executemany(
+            'DELETE FROM session WHERE userid = ?', [(id,) for id in userids])
+    connection.close()
+
+
+def sync_all(cursor: sqlite3.Cursor, checker: Checker, args) -> tuple[list, set, str]:
+    """
+    与数据库中的班级和用户比较, 只写入有变化的行.
+    csv中没有的用户默认保留, 指定--remove时删除
+    """
+    listed_classes = set()
+    class_changes = []
+    for where, (id, name) in checker.rows(args.classes, 2):
+        if (id := checker.integer(where, id)) is None:
+            continue
+        if id in listed_classes:
+            checker.error(where, f'班级{id}重复')
+            continue
+        listed_classes.add(id)
+        if checker.class_names.get(id) != name:
+            class_changes.append((id, name))
+    new_classes = sum(id not in checker.class_names for id, _ in class_changes)
+    checker.class_names.update(class_changes)
+
+    existing = {
+        userid: (username, classid)
+        for userid, username, classid in cursor.execute(
+            'SELECT userid, username, classid FROM user')
+    }
+    listed: dict[int, tuple[str, int]] = {}
+    wheres = {}
+    for where, (id, name, cls) in checker.rows(args.users, 3):
+        id, cls = checker.integer(where, id), checker.integer(where, cls)
+        if id is None or cls is None:
+            continue
+        if id in listed:
+            checker.error(where, f'用户{id}重复')
+        elif cls not in checker.class_names:
+            checker.error(where, f'班级{cls}不存在')
+        else:
+            listed[id] = name, cls
+            wheres[id] = where
+    # 系统用户不在csv中
+    absent = existing.keys() - listed.keys() - {0}
+    removed = absent if args.remove else set()
+
+    # 同步之后用户名仍然唯一
+    owners = {
+        username: userid
+        for userid, (username, _) in existing.items()
+        if userid not in listed and userid not in removed
+    }
+    for id, (name, _) in listed.items():
+        if name in owners:
+            checker.error(wheres[id], f'用户名{name}与用户{owners[name]}重复')
+        owners[name] = id
+    if checker.errors:
+        return [], set(), ''
+
+    added = [
+        (id, name, cls)
+        for id, (name, cls) in listed.items()
+        if id not in existing
+    ]
+    changed = [
+        (id, name, None, cls)
+        for id, (name, cls) in listed.items()
+        if id in existing and existing[id] != (name, cls)
+    ]
+    renamed = [(id,) for id, name, _, _ in changed if existing[id][0] != name]
+    moved = sum(existing[id][1] != cls for id, _, _, cls in changed)
+
+    cursor.executemany(CLASS_UPSERT, class_changes)
+    # 先清空改名用户的用户名, 避免互换用户名时违反UNIQUE约束
+    cursor.executemany('UPDATE user SET username = NULL WHERE userid = ?', renamed)
+    progress = Progress('用户')
+    for batch in batches(args.batch_size, changed):
+        cursor.executemany(USER_UPSERT, batch)
+        progress(len(batch))
+    users = []
+    for batch in batches(args.batch_size, added):
+        users.extend(create_users(cursor, batch, args.password_length, USER_UPSERT))
+        progress(len(batch))
+    for sql in REMOVE_USER:
+        cursor.executemany(sql, [(id,) for id in removed])
+    if removed:
+        bump_generations(cursor, 'volunteer', 'thought', 'notice')
+    progress(len(removed))
+    progress.done()
+    logged_out = removed | {id for id, _, _, _ in changed}
+    return users, logged_out, '\n'.join((
+        f'班级: 新增{new_classes}, 改名{len(class_changes) - new_classes}',
+        f'用户: 新增{len(added)}, 转班{moved}, 改名{len(renamed)}, '
+        + (f'删除{len(removed)}' if args.remove else f'csv中没有{len(absent)}(保留)'),
+        *([f'转班和改名的{len(changed)}个用户需要重新登录'] if changed else [])
+    ))
 
 
 def main() -> None:
@@ -63,49 +349,61 @@ def main() -> None:
                         default=8, help='初始密码的长度(1..32)')
     parser.add_argument('-o', '--output-password',
                         default='password.html', help='输出的密码html文件文件名')
+    parser.add_argument('--output-csv', help='另外输出一份密码csv文件')
     parser.add_argument('-a', '--admin', type=int, nargs='*',
                         help='设为超管的账户ID(若不指定, 则不设置超管)')
+    parser.add_argument('-b', '--batch-size', type=int, default=1000,
+                        help='每次executemany插入的行数')
+    parser.add_argument('-n', '--dry-run', action='store_true',
+                        help='只检查并报告, 不修改数据库, 不输出密码文件')
+    parser.add_argument('-s', '--sync', action='store_true',
+                        help='按csv更新已有的班级和用户(保留密码和权限), 密码文件中只有新用户')
+    parser.add_argument('-r', '--remove', action='store_true',
+                        help='与--sync一起使用, 删除csv中没有的用户及其参与记录和图片, '
+                             '他们创建的义工和发送的通知转给系统用户')
+    parser.add_argument('--sessions', default='instance/sessions.db',
+                        help='会话数据库, 用于让被删除, 转班和改名的用户下线(其他会话存储需要重启服务)')
     args = parser.parse_args()
+    if args.remove and not args.sync:
+        parser.error('--remove只能与--sync一起使用')
 
-    with (open(args.classes, encoding='utf-8') as classes_file,
-          open(args.users, encoding='utf-8') as users_file):
-        classes = list(csv.reader(classes_file))[1:]
-        users = list(csv.reader(users_file))[1:]
-    connection = sqlite3.connect('instance/zvms.db')
+    # 手动管理事务
+    connection = sqlite3.connect('instance/zvms.db', isolation_level=None)
+    relax_pragmas(connection)
     cursor = connection.cursor()
-
-    cursor.executemany(
-        'INSERT INTO class(id, name) '
-        'VALUES(?, ?)',
-        classes
-    )
-    users = [
-        (id, name, generate_password(args.password_length), cls)
-        for id, name, cls in users
-    ]
-    for id, name, pwd, cls in users:
-        try:
-            cursor.execute(
-                'INSERT INTO user(userid, username, password, permission, classid) '
-                'VALUES(?, ?, ?, 0, ?)',
-                (id, name, md5ify(pwd), cls)
+    # 导入期间阻止服务写入, 避免检查之后出现新的冲突
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        checker = Checker(cursor)
+        users, logged_out, summary = (sync_all if args.sync else insert_all)(cursor, checker, args)
+        if args.admin is not None:
+            cursor.executemany(
+                'UPDATE user SET permission = 16 '
+                'WHERE userid = ?',
+                [(i,) for i in args.admin]
             )
-        except sqlite3.IntegrityError as ex:
-            msg, = ex.args
-            if 'UNIQUE' in msg:
-                print(id, msg)
-                exit(1)
-    open(args.output_password, 'w', encoding='utf-8').write(
-        generate_html(users, dict(classes))
-    )
-    if args.admin is not None:
-        cursor.executemany(
-            'UPDATE user SET permission = 16 '
-            'WHERE userid = ?',
-            [(i,) for i in args.admin]
-        )
-    connection.commit()
+        bump_generations(cursor, 'user')
+    except BaseException:
+        cursor.execute('ROLLBACK')
+        raise
+    if checker.errors:
+        cursor.execute('ROLLBACK')
+        print('\n'.join(checker.errors), file=sys.stderr)
+        print(f'{len(checker.errors)}个错误, 未做任何修改', file=sys.stderr)
+        exit(1)
+    if args.dry_run:
+        cursor.execute('ROLLBACK')
+        print(f'检查通过 (dry run, 未做任何修改):\n{summary}')
+        return
+    cursor.execute('COMMIT')
     connection.close()
+    if logged_out:
+        revoke_sessions(args.sessions, logged_out)
+    groups = group_by_class(users)
+    write_html(args.output_password, groups, checker.class_names)
+    if args.output_csv is not None:
+        write_csv(args.output_csv, groups, checker.class_names)
+    print(summary)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,92 @@
+from concurrent.futures import ThreadPoolExecutor
+from argparse import ArgumentParser
+import os
+
+from zvms.assets import (
+    static_files,
+    precompress
+)
+from zvms.pictures import (
+    verify_pictures,
+    collect_garbage,
+    derive_picture,
+    PICTURES_DIR,
+    FILENAME,
+    SIZES
+)
+from zvms.kernel.notice import archive_notices
+from zvms import app
+
+
+def generate_thumbnails(args) -> None:
+    filenames = [
+        file.name
+        for shard in os.scandir(PICTURES_DIR) if shard.is_dir() and shard.name != 'derived'
+        for file in os.scandir(shard.path) if FILENAME.fullmatch(file.name)
+    ]
+    tasks = [(filename, size) for filename in filenames for size in SIZES]
+    with ThreadPoolExecutor(args.jobs) as executor:
+        for i, _ in enumerate(executor.map(lambda task: derive_picture(*task), tasks), 1):
+            if i % 100 == 0 or i == len(tasks):
+                print(f'\r{i}/{len(tasks)}', end='', flush=True)
+    print()
+
+
+def build_assets(args) -> None:
+    paths = [*static_files(), os.path.join(app.root_path, 'favicon.ico')]
+    print(f'{precompress(paths)} files compressed.')
+
+
+def gc(args) -> None:
+    with app.app_context():
+        print(f'{collect_garbage()} pictures removed.')
+
+
+def archive(args) -> None:
+    with app.app_context():
+        print(f'{archive_notices(args.retention)} notices archived.')
+
+
+def verify(args) -> None:
+    with app.app_context():
+        report = verify_pictures(args.fix)
+    for kind, items in report.items():
+        print(f'{kind}: {len(items)}')
+        if args.verbose:
+            for item in items:
+                print(f'    {item}')
+    if args.fix:
+        print('Fixed. Run `gc` to remove orphaned pictures.')
+
+
+def main() -> None:
+    parser = ArgumentParser()
+    subparsers = parser.add_subparsers(required=True)
+
+    thumbnails_parser = subparsers.add_parser('thumbnails', help='为已有的图片生成缩略图')
+    thumbnails_parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count())
+    thumbnails_parser.set_defaults(fn=generate_thumbnails)
+
+    assets_parser = subparsers.add_parser('assets', help='预压缩静态文件, 部署时执行')
+    assets_parser.set_defaults(fn=build_assets)
+
+    gc_parser = subparsers.add_parser('gc', help='删除不再被引用的图片')
+    gc_parser.set_defaults(fn=gc)
+
+    archive_parser = subparsers.add_parser('archive', help='归档过期的通知')
+    archive_parser.add_argument('-r', '--retention', type=int,
+                                default=app.config['NOTICE_RETENTION_DAYS'],
+                                help='过期超过多少天的通知被归档')
+    archive_parser.set_defaults(fn=archive)
+
+    verify_parser = subparsers.add_parser('verify', help='核对图片文件与数据库')
+    verify_parser.add_argument('--fix', action='store_true', help='修复发现的问题')
+    verify_parser.add_argument('-v', '--verbose', action='store_true', help='列出每个文件')
+    verify_parser.set_defaults(fn=verify)
+
+    args = parser.parse_args()
+    args.fn(args)
+
+
+if __name__ == '__main__':
+    main()
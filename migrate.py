@@ -1,110 +1,273 @@
-from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator
+from collections import Counter
 import argparse
+import hashlib
 import sqlite3
+import time
+import csv
 import os.path
 
+from dbutil import bump_generations, batches
 
-def main() -> None:
-    parser = argparse.ArgumentParser()
-    parser.add_argument('-d', '--old-database-path',
-                        default='zvms.db', help='旧数据库的路径')
-    args = parser.parse_args()
+PICTURES_DIR = os.path.join('zvms', 'static', 'pictures')
+CHUNK_SIZE = 64 * 1024
 
-    conn_old = sqlite3.connect(args.old_database_path)
-    conn_new = sqlite3.connect('instance/zvms.db')
 
-    cur_old = conn_old.cursor()
-    cur_new = conn_new.cursor()
+def fetch(cursor: sqlite3.Cursor, size: int) -> Iterator[tuple]:
+    """用fetchmany逐块读取, 不把整张表读入内存"""
+    while rows := cursor.fetchmany(size):
+        yield from rows
 
-    users = cur_old.execute(
+
+PERMISSIONS = {
+    2: 0,
+    10: 1,
+    18: 2,
+    26: 3,
+    34: 4,
+    42: 5,
+    66: 16,
+    130: 8,
+    132: 8
+}
+
+STATUSES = {
+    1: 1,
+    2: 2,
+    4: 3,
+    5: 4,
+    6: 5
+}
+
+
+def users(old: sqlite3.Connection, size: int) -> Iterator[tuple]:
+    # 重名的用户在名字后加上班级
+    counts = Counter(
+        name for name, in fetch(old.execute('SELECT name FROM user'), size))
+    for id, name, cls, pwd, auth in fetch(old.execute(
         'SELECT id, name, class, pwd, auth FROM user'
-    ).fetchall()
-    names = list(map(itemgetter(1), users))
-    users = [
-        (id, n, pwd, {
-            2: 0,
-            10: 1,
-            18: 2,
-            26: 3,
-            34: 4,
-            42: 5,
-            66: 16,
-            130: 8,
-            132: 8
-        }[auth], cls)
-        for id, name, cls, pwd, auth in users
-        if (n := name if names.count(name) == 1
-            else f'{name}{"J" if cls % 100 > 10 else ""}{cls % 10 or 10}'
-            ) or True
-    ]
-    cur_new.executemany(
-        'INSERT INTO user(userid, username, password, permission, classid) '
-        'VALUES(?, ?, ?, ?, ?)',
-        users
-    )
+    ), size):
+        if counts[name] > 1:
+            name = f'{name}{"J" if cls % 100 > 10 else ""}{cls % 10 or 10}'
+        yield id, name, pwd, PERMISSIONS[auth], cls
 
-    cur_old.execute(
-        'SELECT id, name FROM class'
-    )
-    cur_new.executemany(
-        'INSERT INTO class(id, name) VALUES(?, ?)',
-        cur_old.fetchall()
-    )
 
-    cur_old.execute(
+def classes(old: sqlite3.Connection, size: int) -> Iterator[tuple]:
+    return fetch(old.execute('SELECT id, name FROM class'), size)
+
+
+def volunteers(old: sqlite3.Connection, size: int) -> Iterator[tuple]:
+    return fetch(old.execute(
         'SELECT id, name, description, status, holder, type, reward, time FROM volunteer'
-    )
-    cur_new.executemany(
-        'INSERT INTO volunteer(id, name, description, status, holder, type, reward, time) '
-        'VALUES(?, ?, ?, ?, ?, ?, ?, ?)',
-        cur_old.fetchall()
-    )
+    ), size)
 
-    cur_old.execute(
+
+def thoughts(old: sqlite3.Connection, size: int) -> Iterator[tuple]:
+    for status, reward, *spam in fetch(old.execute(
         'SELECT status, reward, stu_id, vol_id, thought FROM stu_vol'
-    )
-    thoughts = [
-        ({
-            1: 1,
-            2: 2,
-            4: 3,
-            5: 4,
-            6: 5
-        }[status], 0 if reward < 0 else reward, *spam)
-        for status, reward, *spam in cur_old.fetchall()
-    ]
-    cur_new.executemany(
-        'INSERT INTO user_vol(status, reward, userid, volid, thought) '
-        'VALUES(?, ?, ?, ?, ?)',
-        thoughts
-    )
+    ), size):
+        yield STATUSES[status], 0 if reward < 0 else reward, *spam
 
-    cur_old.execute(
-        'SELECT class_id, vol_id, max FROM class_vol'
-    )
-    cur_new.executemany(
-        'INSERT INTO class_vol(classid, volid, max) '
-        'VALUES(?, ?, ?)',
-        cur_old.fetchall()
-    )
 
-    pictures = cur_old.execute(
+def class_volunteers(old: sqlite3.Connection, size: int) -> Iterator[tuple]:
+    return fetch(old.execute('SELECT class_id, vol_id, max FROM class_vol'), size)
+
+
+def pictures(old: sqlite3.Connection, size: int) -> Iterator[tuple]:
+    for *spam, digest, extension in fetch(old.execute(
         'SELECT stu_id, vol_id, hash, extension FROM picture'
-    ).fetchall()
-    for *_, digest, extension in pictures:
-        path = os.path.join('zvms', 'static', 'pictures', digest)
-        if os.path.exists(path):
-            os.rename(path, os.path.join('zvms', 'static',
-                                         'pictures', f'{digest}.{extension}'))
-    cur_new.executemany(
+    ), size):
+        yield *spam, f'{digest}.{extension}'
+
+
+# (名称, 读取旧数据的函数, 插入语句), 按顺序执行
+STEPS: list[tuple[str, Callable[[sqlite3.Connection, int], Iterator[tuple]], str]] = [
+    (
+        'user',
+        users,
+        'INSERT INTO user(userid, username, password, permission, classid) '
+        'VALUES(?, ?, ?, ?, ?)'
+    ),
+    (
+        'class',
+        classes,
+        'INSERT INTO class(id, name) VALUES(?, ?)'
+    ),
+    (
+        'volunteer',
+        volunteers,
+        'INSERT INTO volunteer(id, name, description, status, holder, type, reward, time) '
+        'VALUES(?, ?, ?, ?, ?, ?, ?, ?)'
+    ),
+    (
+        'user_vol',
+        thoughts,
+        'INSERT INTO user_vol(status, reward, userid, volid, thought) '
+        'VALUES(?, ?, ?, ?, ?)'
+    ),
+    (
+        'class_vol',
+        class_volunteers,
+        'INSERT INTO class_vol(classid, volid, max) '
+        'VALUES(?, ?, ?)'
+    ),
+    (
+        'picture',
+        pictures,
         'INSERT INTO picture(userid, volid, filename) '
-        'VALUES(?, ?, ?)',
-        ((*spam, f'{digest}.{extension}')
-         for *spam, digest, extension in pictures)
+        'VALUES(?, ?, ?)'
     )
+]
+
+
+def path_of(filename: str) -> str:
+    """与zvms/pictures.py中的相同, 迁移脚本不导入zvms"""
+    return os.path.join(PICTURES_DIR, filename[:2], filename)
+
+
+def md5_of(path: str) -> str:
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def migrate_file(digest: str, extensions: list[str], link: bool) -> list[tuple[str, str]]:
+    """
+    把旧的图片文件(以md5命名, 没有扩展名)移动或硬链接到分片目录中, 并校验内容.
+    同一个文件可能以几个扩展名被引用, 除最后一个目标外都用硬链接.
+    可以重复运行: 已经迁移的文件只校验; 内容不符的文件留在原处.
+    返回每个扩展名的(状态, 路径)
+    """
+    results = {}
+    pending = []
+    for extension in extensions:
+        target = path_of(f'{digest}.{extension}')
+        if os.path.exists(target):
+            results[extension] = ('ok' if md5_of(target) == digest else 'corrupt'), target
+        else:
+            pending.append(extension)
+    # 旧版本的迁移脚本会把文件改名为<md5>.<扩展名>, 但不分片;
+    # 都不存在时从已经迁移的目标链接, 且不能移走它
+    sources = [
+        os.path.join(PICTURES_DIR, digest),
+        *(os.path.join(PICTURES_DIR, f'{digest}.{extension}') for extension in extensions)
+    ]
+    migrated = [path for status, path in results.values() if status == 'ok']
+    source = next((path for path in sources if os.path.exists(path)), None)
+    if source is None and migrated:
+        source, link = migrated[0], True
+    for i, extension in enumerate(pending, 1):
+        target = path_of(f'{digest}.{extension}')
+        if source is None:
+            results[extension] = 'missing', target
+        elif i == 1 and md5_of(source) != digest:
+            results.update((extension, ('corrupt', source)) for extension in pending)
+            break
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if link or i < len(pending):
+                os.link(source, target)
+            else:
+                os.rename(source, target)
+            results[extension] = 'migrated', target
+    return [results[extension] for extension in extensions]
+
+
+def migrate_files(
+    old: sqlite3.Connection,
+    size: int,
+    jobs: int | None,
+    link: bool,
+    manifest: str
+) -> Counter:
+    """并行迁移图片文件, 把缺失和损坏的文件写入manifest"""
+    statuses = Counter()
+    start = time.perf_counter()
+    with (
+        ThreadPoolExecutor(jobs) as executor,
+        open(manifest, 'w', encoding='utf-8', newline='') as f
+    ):
+        writer = csv.writer(f)
+        writer.writerow(('status', 'hash', 'extension', 'path'))
+        # 按文件分组, 同一个文件的几个扩展名在同一个线程中处理
+        for batch in batches(size, fetch(old.execute(
+            'SELECT hash, GROUP_CONCAT(DISTINCT extension) FROM picture GROUP BY hash'
+        ), size)):
+            for (digest, extensions), results in zip(batch, executor.map(
+                lambda row: migrate_file(row[0], row[1].split(','), link), batch
+            )):
+                for extension, (status, path) in zip(extensions.split(','), results):
+                    statuses[status] += 1
+                    if status in ('missing', 'corrupt'):
+                        writer.writerow((status, digest, extension, path))
+            count = statuses.total()
+            elapsed = time.perf_counter() - start
+            print(f'\r{"图片文件":<10}{count:>10}个{count / max(elapsed, 1e-6):>10.0f}个/秒',
+                  end='', flush=True)
+    print()
+    return statuses
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d', '--old-database-path',
+                        default='zvms.db', help='旧数据库的路径')
+    parser.add_argument('-b', '--batch-size', type=int, default=5000,
+                        help='每次读取和插入的行数')
+    parser.add_argument('--restart', action='store_true',
+                        help='忽略之前的进度, 从头开始(需要先清空新数据库)')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='迁移图片文件的线程数(默认由Python决定)')
+    parser.add_argument('--link', action='store_true',
+                        help='用硬链接代替移动, 保留旧的图片文件')
+    parser.add_argument('-m', '--manifest', default='picture-manifest.csv',
+                        help='记录缺失和损坏的图片的csv文件')
+    args = parser.parse_args()
+
+    conn_old = sqlite3.connect(args.old_database_path)
+    conn_new = sqlite3.connect('instance/zvms.db')
+    cur_new = conn_new.cursor()
+
+    # 每张表在一个事务中迁移, 并记录完成; 中断后重新运行时跳过已完成的表
+    cur_new.execute(
+        'CREATE TABLE IF NOT EXISTS migration(step VARCHAR(16) PRIMARY KEY, rows INT)')
+    if args.restart:
+        cur_new.execute('DELETE FROM migration')
+    conn_new.commit()
+    done = dict(cur_new.execute('SELECT step, rows FROM migration'))
+
+    for name, read, sql in STEPS:
+        if name in done:
+            print(f'{name:<12}已完成 ({done[name]}行), 跳过')
+            continue
+        count = 0
+        start = time.perf_counter()
+        for batch in batches(args.batch_size, read(conn_old, args.batch_size)):
+            cur_new.executemany(sql, batch)
+            count += len(batch)
+            elapsed = time.perf_counter() - start
+            print(f'\r{name:<12}{count:>10}行{count / max(elapsed, 1e-6):>10.0f}行/秒',
+                  end='', flush=True)
+        cur_new.execute('INSERT INTO migration(step, rows) VALUES(?, ?)', (name, count))
+        conn_new.commit()
+        elapsed = time.perf_counter() - start
+        print(f'\r{name:<12}{count:>10}行{count / max(elapsed, 1e-6):>10.0f}行/秒'
+              f'{elapsed:>8.1f}秒')
+
+    # 不记录进度: 已经迁移的文件只需校验, 可以放心地重新运行
+    statuses = migrate_files(
+        conn_old, args.batch_size, args.jobs, args.link, args.manifest)
+    print(', '.join(f'{status}: {count}' for status, count in statuses.items()))
+    if statuses['missing'] or statuses['corrupt']:
+        print(f'缺失或损坏的图片已写入{args.manifest}')
 
+    bump_generations(cur_new, 'user', 'volunteer', 'thought', 'notice')
     conn_new.commit()
     conn_new.close()
+    conn_old.close()
 
 
 if __name__ == '__main__':
@@ -1,21 +1,78 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import argparse
 import logging
+import signal
 
+from tornado.web import Application, FallbackHandler
 from tornado.httpserver import HTTPServer
 from tornado.wsgi import WSGIContainer
-from tornado.ioloop import IOLoop
+from tornado.ioloop import IOLoop, PeriodicCallback
 
+from zvms.pictures import collect_garbage
+from zvms.kernel.notice import archive_notices
+from zvms.ratelimit import prune_rate_limit
+from zvms.handlers import (
+    HeartbeatHandler,
+    EventsHandler,
+    AssetHandler,
+    session_topics,
+    api_handlers
+)
+from zvms.api import notice as NoticeApi
+from zvms.api import volunteer as VolunteerApi
+from zvms.toolkit import settings
+from zvms.jinja import warm_up, timings
+from zvms.assets import STATIC_DIR
+from zvms.dispatch import dispatcher
 from zvms.misc import logger
 from zvms import app
 
+
+def run_in_context(job) -> None:
+    with app.app_context():
+        try:
+            job()
+        except Exception as exn:
+            logger.exception(exn)
+
+
+def schedule(io_loop: IOLoop, job, interval: float) -> PeriodicCallback:
+    """每隔interval秒在线程池中执行一次job, 不阻塞IOLoop"""
+    callback = PeriodicCallback(
+        partial(io_loop.run_in_executor, None, run_in_context, job),
+        interval * 1000
+    )
+    callback.start()
+    return callback
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('-p', '--port', type=int, default=4000)
     parser.add_argument('-f', '--logger-file')
+    parser.add_argument('-t', '--threads', type=int, default=8,
+                        help='处理WSGI请求的线程数; 请求总是在线程池中处理, '
+                             '密码哈希等阻塞操作不会占用IOLoop')
     args = parser.parse_args()
+    if args.threads < 1:
+        parser.error('--threads至少为1')
 
-    wsgi = WSGIContainer(app)
-    server = HTTPServer(wsgi)
+    wsgi = WSGIContainer(app, ThreadPoolExecutor(args.threads))
+    server = HTTPServer(Application([
+        (r'/static/(.*)', AssetHandler, {'path': STATIC_DIR}),
+        (r'/(favicon\.ico)', AssetHandler, {'path': app.root_path}),
+        (r'/toolkit/heartbeat', HeartbeatHandler),
+        (r'/events', EventsHandler, {'topics': session_topics(app)}),
+        *api_handlers(app, '/api', [
+            NoticeApi.list_notices,
+            NoticeApi.my_notices,
+            VolunteerApi.list_volunteers,
+            VolunteerApi.my_volunteers,
+            VolunteerApi.search_volunteers
+        ]),
+        (r'.*', FallbackHandler, {'fallback': wsgi})
+    ]))
     server.listen(args.port)
     if args.logger_file is None:
         logger.info('Server started.')
@@ -24,4 +81,40 @@ if __name__ == '__main__':
             filename=args.logger_file,
             force=True
         )
-    IOLoop.instance().start()
\ No newline at end of file
+    io_loop = IOLoop.current()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            io_loop.asyncio_loop.add_signal_handler(sig, io_loop.stop)
+        except NotImplementedError:
+            # Windows: 依靠KeyboardInterrupt退出
+            ...
+    if app.config['TEMPLATE_WARMUP']:
+        warm_up(app)
+    dispatcher.start()
+    schedule(io_loop, collect_garbage, app.config['PICTURE_GC_INTERVAL'])
+    schedule(
+        io_loop,
+        partial(
+            archive_notices,
+            app.config['NOTICE_RETENTION_DAYS'],
+            app.config['NOTICE_ARCHIVE_BATCH']
+        ),
+        app.config['NOTICE_ARCHIVE_INTERVAL']
+    )
+    schedule(io_loop, prune_rate_limit, app.config['LOGIN_RATE_LIMIT_PRUNE_INTERVAL'])
+    # 及时发现其他进程对工具箱设置的修改, 唤醒长轮询
+    PeriodicCallback(
+        partial(settings.refresh, True),
+        app.config['TOOLKIT_SETTINGS_WATCH_INTERVAL'] * 1000
+    ).start()
+    try:
+        io_loop.start()
+    except KeyboardInterrupt:
+        ...
+    finally:
+        dispatcher.stop()
+        settings.close()
+        for name, first, count, average, peak in timings.summary():
+            logger.info(
+                f'{name}: first {first * 1000:.1f} ms, {count} renders, '
+                f'avg {average * 1000:.1f} ms, max {peak * 1000:.1f} ms')
\ No newline at end of file
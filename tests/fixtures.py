@@ -0,0 +1,40 @@
+from tempfile import TemporaryDirectory
+import sqlite3
+import os
+
+from sqlalchemy import create_engine
+
+from zvms import app
+from zvms.session import MemorySessionStore
+from zvms.misc import db
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TemporaryInstance:
+    """使用临时数据库和内存会话, 不触碰instance目录"""
+
+    def __init__(self, script: str = '') -> None:
+        self.script = script
+
+    def __enter__(self) -> 'TemporaryInstance':
+        self.directory = TemporaryDirectory()
+        path = os.path.join(self.directory.name, 'zvms.db')
+        conn = sqlite3.connect(path)
+        with open(os.path.join(ROOT, 'zvms.sql'), encoding='utf-8') as f:
+            conn.executescript(f.read())
+        conn.executescript(self.script)
+        conn.close()
+        engines = db._app_engines[app]
+        self.engine = engines[None]
+        engines[None] = create_engine(f'sqlite:///{path}')
+        self.store = app.session_interface.store
+        app.session_interface.store = MemorySessionStore(16, 600)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        engines = db._app_engines[app]
+        engines[None].dispose()
+        engines[None] = self.engine
+        app.session_interface.store = self.store
+        self.directory.cleanup()
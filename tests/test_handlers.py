@@ -0,0 +1,101 @@
+import unittest
+
+from flask import abort
+from tornado.testing import AsyncHTTPTestCase
+from tornado.web import Application
+
+from zvms import app
+from zvms.api import notice as NoticeApi
+from zvms.handlers import ApiHandler, api_handlers
+
+from fixtures import TemporaryInstance
+
+
+class ApiHandlerTest(AsyncHTTPTestCase):
+    """tornado直接提供的接口应与经过Flask时返回相同的CORS和压缩头"""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        notice = (
+            "INSERT INTO notice(title, content, sender, school, expire) "
+            f"VALUES('通知', '{'内容' * 50}', 20220101, TRUE, '2099-01-01');"
+        )
+        cls.instance = TemporaryInstance(
+            "INSERT INTO user(userid, username, password, permission, classid) "
+            "VALUES(20220101, '张三', '', 0, 1);" + notice * 20
+        ).__enter__()
+        app.session_interface.store.save(
+            'test', 20220101,
+            '{"userid": 20220101, "username": "张三", "classid": 1, "permission": 0}',
+            2 ** 40
+        )
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.instance.__exit__(None, None, None)
+
+    def get_app(self) -> Application:
+        return Application([
+            *api_handlers(app, '/api', [NoticeApi.my_notices]),
+            (r'/api/abort$', ApiHandler, {
+                'app': app,
+                'api': NoticeApi.my_notices.__api__,
+                'fn': lambda: abort(404)
+            })
+        ])
+
+    def headers(self, **extra) -> dict:
+        return {
+            'Cookie': f'{app.config["SESSION_COOKIE_NAME"]}=test',
+            'Origin': 'http://localhost:5173',
+            'Accept-Encoding': 'gzip',
+            **extra
+        }
+
+    def flask(self):
+        # 测试客户端用自己的cookie jar覆盖Cookie头
+        client = app.test_client()
+        client.set_cookie(app.config['SESSION_COOKIE_NAME'], 'test')
+        return client
+
+    def assertSameHeaders(self, tornado, flask, names) -> None:
+        self.assertEqual(tornado.code, flask.status_code)
+        for name in names:
+            self.assertEqual(tornado.headers.get(name), flask.headers.get(name), name)
+
+    def test_get(self) -> None:
+        tornado = self.fetch(
+            '/api/notice/me', headers=self.headers(), decompress_response=False)
+        flask = self.flask().get('/api/notice/me', headers=self.headers())
+        self.assertSameHeaders(tornado, flask, (
+            'Access-Control-Allow-Origin',
+            'Access-Control-Allow-Credentials',
+            'Content-Encoding',
+            'Vary',
+            'ETag'
+        ))
+        self.assertEqual(tornado.headers['Content-Encoding'], 'gzip')
+
+    def test_preflight(self) -> None:
+        headers = self.headers(**{
+            'Access-Control-Request-Method': 'GET',
+            'Access-Control-Request-Headers': 'Content-Type'
+        })
+        tornado = self.fetch('/api/notice/me', method='OPTIONS', headers=headers)
+        flask = self.flask().options('/api/notice/me', headers=headers)
+        self.assertSameHeaders(tornado, flask, (
+            'Access-Control-Allow-Origin',
+            'Access-Control-Allow-Credentials',
+            'Access-Control-Allow-Methods',
+            'Access-Control-Allow-Headers'
+        ))
+
+    def test_http_exception(self) -> None:
+        response = self.fetch('/api/abort', headers=self.headers())
+        self.assertEqual(response.code, 404)
+        self.assertEqual(
+            response.headers['Access-Control-Allow-Origin'], 'http://localhost:5173')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+import hashlib
+
+from zvms import app
+from zvms.ratelimit import MemoryTokenBucket
+
+from fixtures import TemporaryInstance
+
+
+class LoginRateLimitTest(unittest.TestCase):
+    """一个IP反复尝试某个账号时, 从其他IP用正确的密码仍然可以登录"""
+
+    def setUp(self) -> None:
+        password = hashlib.md5(b'pw').hexdigest()
+        self.instance = TemporaryInstance(
+            "INSERT INTO class(id, name) VALUES(202201, '高一一班');"
+            "INSERT INTO user(userid, username, password, permission, classid) "
+            f"VALUES(20220101, '张三', '{password}', 0, 202201);"
+        ).__enter__()
+        self.buckets = app.extensions['login_rate_limit']
+        app.extensions['login_rate_limit'] = (
+            MemoryTokenBucket(*app.config['LOGIN_RATE_LIMIT_IP']),
+            MemoryTokenBucket(*app.config['LOGIN_RATE_LIMIT_USER'])
+        )
+        self.iterations = app.config['PASSWORD_HASH_ITERATIONS']
+        app.config['PASSWORD_HASH_ITERATIONS'] = 1000
+
+    def tearDown(self) -> None:
+        app.config['PASSWORD_HASH_ITERATIONS'] = self.iterations
+        app.extensions['login_rate_limit'] = self.buckets
+        self.instance.__exit__(None, None, None)
+
+    def login(self, ip: str, password: str) -> int:
+        return app.test_client().post(
+            '/user/login',
+            data={'userident': '张三', 'password': password},
+            environ_base={'REMOTE_ADDR': ip}
+        ).status_code
+
+    def test_flood_from_another_ip(self) -> None:
+        capacity, _ = app.config['LOGIN_RATE_LIMIT_USER']
+        for _ in range(capacity * 3):
+            self.assertNotEqual(self.login('10.0.0.1', 'wrong'), 302)
+        # 攻击者自己已经被限流, 即使密码正确
+        self.assertNotEqual(self.login('10.0.0.1', 'pw'), 302)
+        self.assertEqual(self.login('10.0.0.2', 'pw'), 302)
+
+
+if __name__ == '__main__':
+    unittest.main()
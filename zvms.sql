@@ -1,7 +1,7 @@
 CREATE TABLE IF NOT EXISTS user(
     userid INT PRIMARY KEY,
     username VARCHAR(5) UNIQUE,
-    password CHAR(32),
+    password VARCHAR(128),
     permission SMALLINT,
     classid INT,
     FOREIGN KEY (classid) REFERENCES class(id)
@@ -52,6 +52,25 @@ CREATE TABLE IF NOT EXISTS picture(
     FOREIGN KEY (volid) REFERENCES volunteer(id)
 );
 
+CREATE TABLE IF NOT EXISTS blob(
+    filename VARCHAR(36) PRIMARY KEY,
+    refcount INT
+);
+
+CREATE TRIGGER IF NOT EXISTS picture_insert AFTER INSERT ON picture BEGIN
+    INSERT OR IGNORE INTO blob(filename, refcount) VALUES(NEW.filename, 0);
+    UPDATE blob SET refcount = refcount + 1 WHERE filename = NEW.filename;
+END;
+
+CREATE TRIGGER IF NOT EXISTS picture_delete AFTER DELETE ON picture BEGIN
+    UPDATE blob SET refcount = refcount - 1 WHERE filename = OLD.filename;
+END;
+
+CREATE TABLE IF NOT EXISTS generation(
+    name VARCHAR(32) PRIMARY KEY,
+    value INT
+);
+
 CREATE TABLE IF NOT EXISTS issue(
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     author INT,
@@ -86,6 +105,39 @@ CREATE TABLE IF NOT EXISTS class_notice(
     FOREIGN KEY (noticeid) REFERENCES notice(id) 
 );
 
+-- 过期超过保留期的通知, 由后台任务从notice, user_notice和class_notice移入
+CREATE TABLE IF NOT EXISTS notice_archive(
+    id INTEGER PRIMARY KEY,
+    title VARCHAR(32),
+    content TEXT,
+    sender INT,
+    school BOOLEAN,
+    expire DATETIME,
+    archived DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS user_notice_archive(
+    userid INT,
+    noticeid INT,
+    PRIMARY KEY (userid, noticeid)
+);
+
+CREATE TABLE IF NOT EXISTS class_notice_archive(
+    classid INT,
+    noticeid INT,
+    PRIMARY KEY (classid, noticeid)
+);
+
+CREATE TABLE IF NOT EXISTS notice_outbox(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title VARCHAR(32),
+    content TEXT,
+    target INT,
+    class_notice BOOLEAN,
+    expire DATETIME,
+    attempts INT DEFAULT 0
+);
+
 INSERT INTO class(id, name) VALUES(0, '义管会');
 
 INSERT INTO user(userid, username, password, permission, classid) VALUES(0, '系统', '', 0, 0);
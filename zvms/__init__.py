@@ -4,6 +4,13 @@ from flask_cors import CORS
 from .toolkit import Toolkit
 from .views import Views
 from .api import Api
+from .session import init_session
+from .assets import init_assets
+from .compress import init_compress
+from .jinja import init_templates
+from .ratelimit import init_rate_limit
+from .password import init_password
+from .dispatch import dispatcher
 from .misc import db
 from . import config
 
@@ -12,6 +19,13 @@ app.config.from_object(config)
 CORS(app, supports_credentials={'/api/*'})
 
 db.init_app(app)
+init_session(app)
+init_templates(app)
+init_assets(app)
+init_compress(app)
+init_rate_limit(app)
+init_password(app)
+dispatcher.init_app(app)
 
 
 @app.route('/')
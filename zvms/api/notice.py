@@ -15,7 +15,8 @@ from ..util import (
     dump_objects,
     dump_object
 )
-from .user import UserIdAndName
+from ..cache import generations, NOTICE, USER
+from .user import UserIdAndName, ClassIdAndName
 from ..kernel import notice as NoticeKernel
 
 Notice = Blueprint('Notice', __name__, url_prefix='/notice')
@@ -29,21 +30,38 @@ class NoticeInfo(TypedDict):
     senderId: int
     senderName: str
     targets: list[UserIdAndName]
+    classes: list[ClassIdAndName]
 
 
-@api_route(Notice, url.list, 'GET')
+class SelectNotices(TypedDict):
+    count: int
+    data: list[NoticeInfo]
+
+
+@api_route(
+    Notice,
+    url.list['page'],
+    'GET',
+    version=lambda page: (generations(NOTICE, USER), page)
+)
 @api_login_required
 @permission(Permission.MANAGER)
-def list_notices() -> list[NoticeInfo]:
+def list_notices(page: int) -> SelectNotices:
     """
-列出所有通知  
+分页列出所有通知  
 用于管理员的编辑通知功能
     """
-    return [
-        dump_object(spam, NoticeInfo) | {
-            'targets': dump_objects(targets, UserIdAndName)}
-        for *spam, targets in NoticeKernel.list_notices()
-    ]
+    count, data = NoticeKernel.list_notices(page)
+    return {
+        'count': count,
+        'data': [
+            dump_object(spam, NoticeInfo) | {
+                'targets': dump_objects(targets, UserIdAndName),
+                'classes': dump_objects(classes, ClassIdAndName)
+            }
+            for *spam, targets, classes in data
+        ]
+    }
 
 
 class MyNotice(TypedDict):
@@ -54,7 +72,13 @@ class MyNotice(TypedDict):
     senderName: str
 
 
-@api_route(Notice, url.me, 'GET')
+@api_route(
+    Notice,
+    url.me,
+    'GET',
+    # 过期的通知不再显示
+    version=lambda: (generations(NOTICE), date.today())
+)
 @api_login_required
 def my_notices() -> list[MyNotice]:
     """列出一个人所能看到的所有通知"""
@@ -69,15 +93,22 @@ def send_notice(
     content: str,
     anonymous: bool,
     targets: list[str],
-    expire: date
+    expire: date,
+    classes: list[int] = [],
+    grades: list[int] = []
 ) -> None:
-    """发送通知"""
+    """
+发送通知  
+targets为用户名或学号, classes为班级ID, grades为年级(如2022), 至少提供一种目标
+    """
     NoticeKernel.send_notice(
         title,
         content,
         anonymous,
         targets,
-        expire
+        expire,
+        classes,
+        grades
     )
 
 
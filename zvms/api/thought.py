@@ -1,5 +1,6 @@
 from typing import TypedDict
 from base64 import b64decode
+import io
 
 from flask import Blueprint
 
@@ -135,9 +136,10 @@ def edit_thought(
 ) -> None:
     """编辑感想"""
     _files = []
-    for filename, data in files:
+    for file in files:
+        filename = file['filename']
         try:
-            files.append((filename, b64decode(data)))
+            _files.append(io.BytesIO(b64decode(file['data'])))
         except:
             raise ZvmsError(ErrorCode.FILE_DECODE_FAILS,
                             {'filename': filename})
@@ -13,6 +13,7 @@ from ..util import (
     dump_object
 )
 from ..misc import Permission
+from ..cache import generations, USER
 from ..kernel import user as UserKernel
 
 User = Blueprint('User', __name__, url_prefix='/user')
@@ -48,7 +49,7 @@ def user_logout() -> None:
     session.clear()
 
 
-@api_route(User, url['userid'], 'GET')
+@api_route(User, url['userid'], 'GET', version=lambda userid: generations(USER))
 @api_login_required
 def get_user_info(userid: int) -> UserInfo:
     """获取用户信息"""
@@ -88,7 +89,7 @@ class ClassIdAndName(TypedDict):
     name: str
 
 
-@api_route(User, url('class').list, 'GET')
+@api_route(User, url('class').list, 'GET', version=lambda: generations(USER))
 @api_login_required
 def list_classes() -> list[ClassIdAndName]:
     """获取班级列表"""
@@ -105,7 +106,7 @@ class ClassInfo(TypedDict):
     members: list[UserIdAndName]
 
 
-@api_route(User, url('class')['classid'], 'GET')
+@api_route(User, url('class')['classid'], 'GET', version=lambda classid: generations(USER))
 @api_login_required
 def get_class_info(classid: int) -> ClassInfo:
     """获取班级信息"""
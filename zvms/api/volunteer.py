@@ -22,6 +22,12 @@ from ..misc import (
     VolKind,
     VolType
 )
+from ..cache import (
+    generations,
+    VOLUNTEER,
+    THOUGHT,
+    USER
+)
 from .user import UserIdAndName
 from ..kernel import volunteer as VolKernel
 from ..kernel.volunteer import SelectResult
@@ -91,7 +97,13 @@ class VolunteerInfo(TypedDict):
     signups: list[UserIdAndName]
 
 
-@api_route(Volunteer, url['volid'], 'GET')
+@api_route(
+    Volunteer,
+    url['volid'],
+    'GET',
+    # 能否报名与日期有关
+    version=lambda volid: (generations(VOLUNTEER, THOUGHT, USER), date.today())
+)
 @api_login_required
 def get_volunteer_info(volid: int) -> VolunteerInfo:
     """获取义工信息"""
@@ -0,0 +1,88 @@
+from functools import cache
+import hashlib
+import gzip
+import os
+
+from flask import Flask
+
+from .misc import logger
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), 'static')
+
+# 图片另由/picture提供
+EXCLUDED = {'pictures'}
+
+# 已经压缩过的格式(png, woff2等)再压缩没有意义
+COMPRESSIBLE = {'.css', '.js', '.html', '.svg', '.json', '.txt', '.ico', '.ttf', '.woff'}
+
+# 按优先级排列
+ENCODINGS = [
+    ('br', '.br'),
+    ('gzip', '.gz')
+]
+
+
+@cache
+def _fingerprint(path: str, mtime: float) -> str:
+    with open(path, 'rb') as file:
+        return hashlib.md5(file.read()).hexdigest()[:12]
+
+
+def static_url(filename: str) -> str:
+    """带内容指纹的静态文件地址, 内容改变时地址随之改变, 因此可以永久缓存"""
+    path = os.path.join(STATIC_DIR, filename)
+    try:
+        version = _fingerprint(path, os.stat(path).st_mtime)
+    except FileNotFoundError:
+        logger.warning(f'Static file {filename} not found.')
+        return f'/static/{filename}'
+    return f'/static/{filename}?v={version}'
+
+
+def init_assets(app: Flask) -> None:
+    app.jinja_env.globals['static_url'] = static_url
+
+
+def static_files(root: str = STATIC_DIR):
+    for entry in os.scandir(root):
+        if entry.is_dir():
+            if entry.name not in EXCLUDED:
+                yield from static_files(entry.path)
+        elif entry.is_file():
+            yield entry.path
+
+
+def _compress(path: str, suffix: str, compress) -> bool:
+    target = path + suffix
+    if os.path.exists(target) and os.stat(target).st_mtime >= os.stat(path).st_mtime:
+        return False
+    with open(path, 'rb') as file:
+        data = file.read()
+    if len(content := compress(data)) >= len(data):
+        return False
+    with open(target + '.part', 'wb') as file:
+        file.write(content)
+    os.replace(target + '.part', target)
+    return True
+
+
+def precompress(paths) -> int:
+    """
+    生成.gz和(安装了brotli时).br的预压缩文件, 由run.py中的AssetHandler按Accept-Encoding选用
+    跳过比原文件新的已有结果, 返回新生成的文件数
+    """
+    if brotli is None:
+        logger.warning('`brotli` not found. Only gzip variants will be generated.')
+    count = 0
+    for path in paths:
+        if os.path.splitext(path)[1] not in COMPRESSIBLE:
+            continue
+        count += _compress(path, '.gz', lambda data: gzip.compress(data, 9, mtime=0))
+        if brotli is not None:
+            count += _compress(path, '.br', lambda data: brotli.compress(data, quality=11))
+    return count
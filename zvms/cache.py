@@ -0,0 +1,130 @@
+from collections import OrderedDict
+from typing import Callable, Hashable, Any
+from functools import wraps
+import threading
+import time
+
+from markupsafe import Markup
+
+from .util import execute_many, execute_sql
+from . import config
+
+# 代数(generation)存放在数据库的generation表中, 与写操作在同一个事务里递增,
+# 因此多个进程共享同一份失效信息, 回滚时也不会误失效
+VOLUNTEER = 'volunteer'  # volunteer和class_vol表
+THOUGHT = 'thought'  # user_vol表
+USER = 'user'  # user和class表
+NOTICE = 'notice'  # notice, user_notice和class_notice表
+
+
+def bump(*names: str) -> None:
+    execute_many(
+        'INSERT OR IGNORE INTO generation(name, value) VALUES(:name, 0)',
+        [{'name': name} for name in names]
+    )
+    execute_sql(
+        'UPDATE generation SET value = value + 1 WHERE name IN :names',
+        names=list(names)
+    )
+    # 本进程立即失效, 其他进程在下次检查代数时失效
+    for name in names:
+        if name in references:
+            references[name].clear()
+
+
+def generations(*names: str) -> tuple[int, ...]:
+    values = dict(execute_sql(
+        'SELECT name, value FROM generation WHERE name IN :names',
+        names=list(names)
+    ).fetchall())
+    return tuple(values.get(name, 0) for name in names)
+
+
+def invalidates(*names: str):
+    """被修饰的kernel函数正常返回时递增给定的代数"""
+    def decorator(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            ret = fn(*args, **kwargs)
+            bump(*names)
+            return ret
+        return wrapper
+    return decorator
+
+
+class FragmentCache:
+    """进程内的LRU缓存, 键中包含依赖的代数, 代数改变后旧条目不再命中并逐渐被淘汰"""
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.entries: OrderedDict[Hashable, Markup] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, depends: tuple[str, ...], render: Callable[[], str]) -> Markup:
+        key = key, generations(*depends)
+        with self.lock:
+            if (fragment := self.entries.get(key)) is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return fragment
+            self.misses += 1
+        fragment = Markup(render())
+        with self.lock:
+            self.entries[key] = fragment
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+        return fragment
+
+
+class ReferenceCache:
+    """
+    很少改变的参考数据(班级, 班级成员, 用户名)的进程内缓存.
+    条目在ttl秒后过期, 或者在代数改变时全部失效; 代数最多每stamp_interval秒读取一次
+    """
+
+    def __init__(self, name: str, ttl: float, stamp_interval: float) -> None:
+        self.name = name
+        self.ttl = ttl
+        self.stamp_interval = stamp_interval
+        self.entries: dict[Hashable, tuple[float, Any]] = {}
+        self.stamp: int | None = None
+        self.checked = 0.0
+        self.lock = threading.Lock()
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.checked = 0.0
+
+    def _check_stamp(self, now: float) -> None:
+        if now - self.checked < self.stamp_interval:
+            return
+        stamp, = generations(self.name)
+        with self.lock:
+            if stamp != self.stamp:
+                self.entries.clear()
+                self.stamp = stamp
+            self.checked = now
+
+    def cached(self, fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args):
+            now = time.monotonic()
+            self._check_stamp(now)
+            key = fn.__name__, args
+            match self.entries.get(key):
+                case [expires, value] if expires > now:
+                    return value
+            value = fn(*args)
+            with self.lock:
+                self.entries[key] = now + self.ttl, value
+            return value
+        return wrapper
+
+
+fragments = FragmentCache(config.FRAGMENT_CACHE_SIZE)
+references = {
+    USER: ReferenceCache(USER, config.REFERENCE_CACHE_TTL, config.REFERENCE_STAMP_INTERVAL)
+}
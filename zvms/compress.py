@@ -0,0 +1,156 @@
+from typing import Callable, Iterable
+import zlib
+
+from flask import Flask
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = {
+    'text/html',
+    'text/plain',
+    'text/css',
+    'text/csv',
+    'text/javascript',
+    'application/javascript',
+    'application/json',
+    'image/svg+xml'
+}
+
+
+class Encoder:
+    def __init__(self, /, encoding: str, level: int) -> None:
+        self.encoding = encoding
+        match encoding:
+            case 'br':
+                self.compressor = brotli.Compressor(quality=level)
+                self.process = self.compressor.process
+                self.finish = self.compressor.finish
+            case 'gzip':
+                # wbits=31: 带gzip头
+                self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+                self.process = self.compressor.compress
+                self.finish = self.compressor.flush
+
+
+class CompressMiddleware:
+    """
+    按Accept-Encoding压缩文本响应.
+    有Content-Length的响应整体压缩, 小于阈值的不压缩;
+    没有Content-Length的流式响应(如CSV导出)逐块压缩, 只在结束时flush.
+    tornado的WSGIContainer会先合并整个响应体, 只有在真正流式的WSGI服务器下才会逐块发送
+    """
+
+    def __init__(
+        self,
+        /,
+        wsgi_app: Callable,
+        gzip_level: int,
+        brotli_quality: int,
+        min_size: int
+    ) -> None:
+        self.wsgi_app = wsgi_app
+        self.levels = {'gzip': gzip_level}
+        if brotli is not None:
+            self.levels['br'] = brotli_quality
+        self.min_size = min_size
+
+    def negotiate(self, /, accept_encoding: str) -> str | None:
+        accepted = {}
+        for item in accept_encoding.split(','):
+            encoding, _, params = item.strip().partition(';')
+            quality = 1.0
+            if params.strip().startswith('q='):
+                try:
+                    quality = float(params.strip()[2:])
+                except ValueError:
+                    ...
+            accepted[encoding.strip()] = quality
+        # 优先br
+        for encoding in ('br', 'gzip'):
+            if encoding in self.levels and accepted.get(encoding, accepted.get('*', 0)) > 0:
+                return encoding
+        return None
+
+    def __call__(self, environ: dict, start_response: Callable) -> Iterable[bytes]:
+        captured = []
+
+        def capture(status, headers, exc_info=None):
+            # Flask不使用start_response返回的write
+            captured[:] = [status, headers, exc_info]
+
+        body = self.wsgi_app(environ, capture)
+        status, headers, exc_info = captured
+        names = {name.lower(): value for name, value in headers}
+        if (
+            environ['REQUEST_METHOD'] == 'HEAD' or
+            not status.startswith('200') or
+            names.get('content-type', '').split(';')[0].strip() not in COMPRESSIBLE or
+            'content-encoding' in names or
+            'no-transform' in names.get('cache-control', '')
+        ):
+            start_response(status, headers, exc_info)
+            return body
+        headers = [
+            (name, value) for name, value in headers
+            if name.lower() != 'vary'
+        ]
+        vary = [v.strip() for v in names.get('vary', '').split(',') if v.strip()]
+        headers.append(('Vary', ', '.join([*vary, 'Accept-Encoding'])))
+        encoding = self.negotiate(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        length = names.get('content-length')
+        if encoding is None or (length is not None and int(length) < self.min_size):
+            start_response(status, headers, exc_info)
+            return body
+        headers = [
+            (name, value) for name, value in headers
+            if name.lower() not in ('content-length', 'etag')
+        ]
+        headers.append(('Content-Encoding', encoding))
+        if 'etag' in names:
+            # 压缩后的内容不再逐字节相同, 只能是弱ETag
+            etag = names['etag']
+            headers.append(('ETag', etag if etag.startswith('W/') else 'W/' + etag))
+        encoder = Encoder(encoding, self.levels[encoding])
+        if length is not None:
+            try:
+                compressed = b''.join(map(encoder.process, body)) + encoder.finish()
+            finally:
+                if hasattr(body, 'close'):
+                    body.close()
+            headers.append(('Content-Length', str(len(compressed))))
+            start_response(status, headers, exc_info)
+            return [compressed]
+        start_response(status, headers, exc_info)
+        return self.stream(body, encoder)
+
+    def encode(self, /, accept_encoding: str, body: bytes) -> tuple[str | None, bytes]:
+        """整体压缩一个响应体, 供不经过WSGI的处理器(zvms/handlers.py)使用"""
+        encoding = self.negotiate(accept_encoding)
+        if encoding is None or len(body) < self.min_size:
+            return None, body
+        encoder = Encoder(encoding, self.levels[encoding])
+        return encoding, encoder.process(body) + encoder.finish()
+
+    @staticmethod
+    def stream(body: Iterable[bytes], encoder: Encoder) -> Iterable[bytes]:
+        try:
+            for chunk in body:
+                # 压缩器缓冲不足一块的输出
+                if chunk and (compressed := encoder.process(chunk)):
+                    yield compressed
+            yield encoder.finish()
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+
+
+def init_compress(app: Flask) -> None:
+    app.wsgi_app = app.extensions['compress'] = CompressMiddleware(
+        app.wsgi_app,
+        app.config['COMPRESS_LEVEL'],
+        app.config['COMPRESS_BROTLI_QUALITY'],
+        app.config['COMPRESS_MIN_SIZE']
+    )
@@ -1,2 +1,65 @@
 SECRET_KEY = '2rwefdfswdfshwrr'
-SQLALCHEMY_DATABASE_URI = 'sqlite:///zvms.db'
\ No newline at end of file
+SQLALCHEMY_DATABASE_URI = 'sqlite:///zvms.db'
+
+# 会话存储: 'cookie'(签名cookie), 'memory'(单进程LRU), 'sqlite'(多进程共享)
+SESSION_STORE = 'sqlite'
+SESSION_STORE_PATH = 'sessions.db'
+SESSION_STORE_CAPACITY = 8192
+SESSION_SWEEP_INTERVAL = 600
+
+PASSWORD_HASH_ITERATIONS = 100000
+PASSWORD_HASH_WORKERS = 2
+PASSWORD_VERIFY_CACHE_SIZE = 1024
+
+# 登录限流: 'memory'(单进程), 'sqlite'(多进程共享); 令牌桶为(容量, 每秒补充的令牌数)
+# 每个IP一个桶, 每个(账号, IP)一个桶
+LOGIN_RATE_LIMIT_STORE = 'sqlite'
+LOGIN_RATE_LIMIT_PATH = 'ratelimit.db'
+LOGIN_RATE_LIMIT_IP = (30, 0.5)
+LOGIN_RATE_LIMIT_USER = (5, 1 / 60)
+# 清理已经回满的令牌桶的间隔(秒)
+LOGIN_RATE_LIMIT_PRUNE_INTERVAL = 60 * 60
+
+# 通知异步投递
+NOTICE_DISPATCH_BATCH = 500
+NOTICE_DISPATCH_INTERVAL = 5
+NOTICE_DISPATCH_MAX_ATTEMPTS = 5
+
+# 清理不再被引用的图片的间隔(秒)
+PICTURE_GC_INTERVAL = 60 * 60
+
+# 过期超过NOTICE_RETENTION_DAYS天的通知移入归档表
+NOTICE_RETENTION_DAYS = 30
+NOTICE_ARCHIVE_INTERVAL = 60 * 60
+NOTICE_ARCHIVE_BATCH = 500
+
+# 响应压缩, 小于COMPRESS_MIN_SIZE字节的响应不压缩
+COMPRESS_LEVEL = 6
+COMPRESS_BROTLI_QUALITY = 4
+COMPRESS_MIN_SIZE = 1024
+
+# 模板字节码缓存目录(相对于instance), None表示不缓存; 启动时是否预编译所有模板
+TEMPLATE_BYTECODE_CACHE = 'jinja'
+TEMPLATE_WARMUP = True
+# 渲染超过这个时间(秒)时记录警告
+TEMPLATE_SLOW_RENDER = 0.2
+
+# 列表页片段缓存的条目数
+FRAGMENT_CACHE_SIZE = 1024
+
+# 班级等参考数据的缓存时间(秒), 以及检查其他进程是否修改了数据的间隔(秒)
+REFERENCE_CACHE_TTL = 600
+REFERENCE_STAMP_INTERVAL = 1
+
+# 检查其他进程是否修改了工具箱设置的间隔(秒), 心跳长轮询的最长等待时间(秒)
+TOOLKIT_SETTINGS_WATCH_INTERVAL = 1
+HEARTBEAT_MAX_WAIT = 30
+
+# SSE: 保活间隔(秒), 客户端重连间隔(秒), 每个连接最多缓存的消息数
+EVENTS_KEEPALIVE = 25
+EVENTS_RETRY = 5
+EVENTS_QUEUE_SIZE = 64
+
+# 由tornado直接处理的只读接口: 数据库线程数, 最多排队的请求数
+API_THREADS = 4
+API_MAX_PENDING = 256
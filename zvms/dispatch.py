@@ -0,0 +1,200 @@
+from itertools import groupby
+from operator import itemgetter
+import threading
+
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .pubsub import publish_after_commit
+from .cache import bump, NOTICE
+from .misc import db, logger
+from .util import (
+    get_primary_key,
+    execute_many,
+    execute_sql
+)
+
+
+class NoticeDispatcher:
+    """
+    后台线程批量投递notice_outbox中的通知.
+    内容相同的通知合并为一条notice和多个目标, 审核一个300人的义工只需要插入一条notice
+    """
+
+    def __init__(self) -> None:
+        self.app: Flask | None = None
+        self.thread: threading.Thread | None = None
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+
+    def init_app(self, app: Flask) -> None:
+        self.app = app
+        self.batch_size = app.config['NOTICE_DISPATCH_BATCH']
+        self.interval = app.config['NOTICE_DISPATCH_INTERVAL']
+        self.max_attempts = app.config['NOTICE_DISPATCH_MAX_ATTEMPTS']
+
+    def start(self) -> None:
+        with self.lock:
+            if self.thread is not None or self.stopping.is_set():
+                return
+            self.thread = threading.Thread(
+                target=self.run,
+                name='notice-dispatcher',
+                daemon=True
+            )
+            self.thread.start()
+
+    def wake(self) -> None:
+        self.start()
+        self.wakeup.set()
+
+    def stop(self) -> None:
+        """停止后台线程并投递完剩余的通知"""
+        self.stopping.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+        try:
+            remaining = self.drain()
+        except Exception as exn:
+            logger.exception(exn)
+        else:
+            logger.info(f'Notice dispatcher stopped, {remaining} notices drained.')
+
+    def run(self) -> None:
+        failures = 0
+        while not self.stopping.is_set():
+            try:
+                self.drain()
+                failures = 0
+            except Exception as exn:
+                failures += 1
+                logger.exception(exn)
+            self.wakeup.wait(self.interval * 2 ** min(failures, 6))
+            self.wakeup.clear()
+
+    def drain(self) -> int:
+        total = 0
+        with self.app.app_context():
+            self.purge()
+            while count := self.deliver_batch():
+                total += count
+        return total
+
+    def purge(self) -> None:
+        """记录并删除投递失败次数过多的通知"""
+        for id, title, target, class_notice, attempts in execute_sql(
+            'DELETE FROM notice_outbox WHERE attempts >= :max_attempts '
+            'RETURNING id, title, target, class_notice, attempts',
+            max_attempts=self.max_attempts
+        ).fetchall():
+            logger.error(
+                f'Notice {id} ({title!r} to {"class" if class_notice else "user"} '
+                f'{target}) dropped after {attempts} attempts')
+        db.session.commit()
+
+    def claim(self, limit: int, id: int | None = None) -> list:
+        """
+        删除即认领: 事务的第一条语句就是写操作, 持有写锁直到提交,
+        其他进程不会读到同一批通知; 投递失败回滚时通知回到outbox中
+        """
+        return execute_sql(
+            'DELETE FROM notice_outbox WHERE id IN ('
+            'SELECT id FROM notice_outbox '
+            'WHERE attempts < :max_attempts AND (:id IS NULL OR id = :id) '
+            'ORDER BY id '
+            'LIMIT :limit'
+            ') RETURNING id, title, content, expire, class_notice, target',
+            max_attempts=self.max_attempts,
+            limit=limit,
+            id=id
+        ).fetchall()
+
+    def deliver_batch(self) -> int:
+        rows = self.claim(self.batch_size)
+        if not rows:
+            return 0
+        try:
+            self.deliver(rows)
+            db.session.commit()
+        except Exception as exn:
+            db.session.rollback()
+            logger.exception(exn)
+        else:
+            return len(rows)
+        # 逐条重试, 一条坏数据不会耗尽同一批其他通知的重试次数
+        error = None
+        for id, *_ in rows:
+            error = self.retry(id) or error
+        if error is not None:
+            # 让run()退避
+            raise error
+        return len(rows)
+
+    def retry(self, id: int) -> Exception | None:
+        rows = self.claim(1, id)
+        try:
+            self.deliver(rows)
+            db.session.commit()
+        except Exception as exn:
+            db.session.rollback()
+            attempts = execute_sql(
+                'UPDATE notice_outbox SET attempts = attempts + 1 WHERE id = :id '
+                'RETURNING attempts',
+                id=id
+            ).scalar()
+            db.session.commit()
+            if attempts is not None and attempts >= self.max_attempts:
+                self.purge()
+            return exn
+        return None
+
+    def deliver(self, rows: list) -> None:
+        for (title, content, expire, class_notice), group in groupby(
+            sorted(rows, key=itemgetter(1, 2, 3, 4)),
+            key=itemgetter(1, 2, 3, 4)
+        ):
+            execute_sql(
+                'INSERT INTO notice(title, content, sender, school, expire) '
+                'VALUES(:title, :content, 0, FALSE, :expire)',
+                title=title,
+                content=content,
+                expire=expire
+            )
+            noticeid = get_primary_key()
+            targets = {row[5] for row in group}
+            execute_many(
+                'INSERT OR IGNORE INTO {}({}, noticeid) '
+                'VALUES(:target, :noticeid)'.format(
+                    'class_notice' if class_notice else 'user_notice',
+                    'classid' if class_notice else 'userid'
+                ),
+                [
+                    {'target': target, 'noticeid': noticeid}
+                    for target in targets
+                ]
+            )
+            for target in targets:
+                publish_after_commit(
+                    f'{"class" if class_notice else "user"}:{target}',
+                    'notice',
+                    {'title': title}
+                )
+        if rows:
+            bump(NOTICE)
+
+
+dispatcher = NoticeDispatcher()
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_after_commit(session: Session) -> None:
+    if session.info.pop('notice_outbox', False):
+        dispatcher.wake()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_after_rollback(session: Session, previous_transaction) -> None:
+    session.info.pop('notice_outbox', None)
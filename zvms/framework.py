@@ -15,13 +15,14 @@ from functools import wraps
 from datetime import date
 from enum import EnumType
 from typing import Any
+import hashlib
 import json
 
 from flask import Blueprint, Response, session, request, redirect, abort
 from werkzeug.datastructures import ImmutableMultiDict, FileStorage
 from werkzeug.exceptions import NotFound, Forbidden
 
-from .misc import db, logger, Permission, ErrorCode
+from .misc import db, logger, Permission, ErrorCode, principal
 
 
 class Validator(metaclass=ABCMeta):
@@ -380,7 +381,8 @@ class Api:
         doc: str,
         permission: Permission,
         params: dict[str, type],
-        returns: type
+        returns: type,
+        version: Callable[..., Any] | None
     ) -> None:
         self.blueprint = blueprint
         self.name = name
@@ -390,18 +392,34 @@ class Api:
         self.permission = permission
         self.params = params
         self.returns = returns
+        self.version = version
         self.total_params = params | url.params
 
     apis: list['Api'] = []
 
 
+def version_etag(name: str, key: Any) -> str:
+    """版本键对应的ETag, 与当前用户有关"""
+    return hashlib.md5(repr((
+        name,
+        principal.userid,
+        principal.permission,
+        key
+    )).encode()).hexdigest()
+
+
 def route(
     blueprint: Blueprint,
     url: Url,
     method: Literal['GET', 'POST'] = 'POST',
     *,
-    mode: RouteMode
+    mode: RouteMode,
+    version: Callable[..., Any] | None = None
 ) -> Callable[[Callable], Callable]:
+    """
+    version: 接受URL参数, 返回廉价计算的版本键(如数据表的代数).
+    GET请求的If-None-Match与版本键对应的ETag相同时直接返回304, 不执行fn
+    """
     from .util import render_template
     if mode == 'json':
         def error(errorn: int, kwargs=MappingProxyType({})) -> str:
@@ -421,8 +439,18 @@ def route(
             if name not in url.params
         })
 
+        def make_etag(kwargs: dict) -> str | None:
+            # 未登录的请求照常执行, 由login_required处理
+            if version is None or method != 'GET' or not principal.authenticated:
+                return None
+            return version_etag(fn.__name__, version(**kwargs))
+
         @wraps(fn)
         def wrapper(*args, **kwargs):
+            if (etag := make_etag(kwargs)) is not None and request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
             if mode == 'json':
                 try:
                     args_dict = json.loads(request.get_data().decode())
@@ -436,10 +464,16 @@ def route(
                 if isinstance(ret, Response):
                     return ret
                 if mode == 'json':
-                    return json.dumps({
+                    ret = json.dumps({
                         'errorn': ErrorCode.NO_ERROR,
                         'data': ret
                     })
+                if etag is not None:
+                    ret = Response(ret)
+                    ret.set_etag(etag)
+                    # 每次都要向服务器确认, 但多数情况下只得到304
+                    ret.cache_control.private = True
+                    ret.cache_control.no_cache = True
                 return ret
             except (NotFound, Forbidden):
                 raise
@@ -464,8 +498,10 @@ def route(
                     for name, param in sig.parameters.items()
                     if name not in url.params
                 },
-                sig.return_annotation
+                sig.return_annotation,
+                version
             )
+            wrapper.__api__ = api
             Api.apis.append(api)
             if not hasattr(blueprint, '__apis__'):
                 blueprint.__apis__ = []
@@ -502,7 +538,7 @@ def permission(perm: Permission) -> Callable[[Callable], Callable]:
     def deco(fn: Callable) -> Callable:
         @wraps(fn)
         def wrapper(*args, **kwargs):
-            if int(session.get('permission')) & (perm | Permission.ADMIN):
+            if principal.permission & (perm | Permission.ADMIN):
                 return fn(*args, **kwargs)
             abort(403)
         wrapper.__perm__ = perm
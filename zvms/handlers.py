@@ -0,0 +1,329 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from inspect import unwrap
+from typing import Callable
+import mimetypes
+import json
+import re
+import os
+
+from flask import Flask, Request
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
+from tornado.web import RequestHandler, StaticFileHandler
+from tornado.iostream import StreamClosedError
+from tornado.queues import Queue, QueueFull
+from tornado.httputil import HTTPServerRequest
+from tornado.ioloop import IOLoop
+from tornado.locks import Event
+from tornado.util import TimeoutError
+
+from .toolkit import settings
+from .framework import Api, ZvmsError, version_etag
+from .misc import Principal, ErrorCode
+from .compress import CompressMiddleware
+from .pubsub import broker
+from .assets import ENCODINGS
+from . import config
+
+
+class AssetHandler(StaticFileHandler):
+    """
+    在IOLoop线程中直接提供静态文件, 不占用处理WSGI请求的线程.
+    带?v=指纹或者其他查询参数(如字体的版本号)的请求永久缓存,
+    客户端接受时返回预先压缩好的.br/.gz文件
+    """
+
+    def validate_absolute_path(self, root: str, absolute_path: str) -> str | None:
+        if (absolute_path := super().validate_absolute_path(root, absolute_path)) is None:
+            return None
+        self.set_header('Vary', 'Accept-Encoding')
+        accepted = {
+            encoding.split(';')[0].strip()
+            for encoding in self.request.headers.get('Accept-Encoding', '').split(',')
+        }
+        for encoding, suffix in ENCODINGS:
+            if encoding not in accepted:
+                continue
+            try:
+                stat = os.stat(absolute_path + suffix)
+            except FileNotFoundError:
+                continue
+            # 原文件更新而压缩结果过期时不使用
+            if stat.st_mtime < os.stat(absolute_path).st_mtime:
+                continue
+            self.set_header('Content-Encoding', encoding)
+            # 让Content-Length等描述实际发送的文件
+            self._stat_result = stat
+            return absolute_path + suffix
+        return absolute_path
+
+    def get_content_type(self) -> str:
+        path = self.absolute_path
+        for _, suffix in ENCODINGS:
+            path = path.removesuffix(suffix)
+        mime_type, _ = mimetypes.guess_type(path)
+        return mime_type or 'application/octet-stream'
+
+    def get_cache_time(self, path: str, modified, mime_type: str) -> int:
+        return self.CACHE_MAX_AGE if self.request.query else 0
+
+    def set_extra_headers(self, path: str) -> None:
+        if self.request.query:
+            self.set_header(
+                'Cache-Control', f'public, max-age={self.CACHE_MAX_AGE}, immutable')
+
+
+class HeartbeatHandler(RequestHandler):
+    """
+    /toolkit/heartbeat: 响应体和ETag是预先生成的.
+    带?wait=秒数且If-None-Match与当前ETag相同时, 挂起直到设置改变或超时, 期间不占用线程
+    """
+    changed = Event()
+    io_loop: IOLoop | None = None
+
+    @classmethod
+    def notify(cls) -> None:
+        # 可能在写设置的请求线程中调用
+        if cls.io_loop is not None:
+            cls.io_loop.add_callback(cls.wake)
+
+    @classmethod
+    def wake(cls) -> None:
+        cls.changed.set()
+        cls.changed = Event()
+
+    def compute_etag(self) -> str | None:
+        return f'"{self.etag}"'
+
+    async def get(self) -> None:
+        HeartbeatHandler.io_loop = IOLoop.current()
+        body, self.etag = settings.heartbeat()
+        try:
+            wait = min(float(self.get_argument('wait', '0')), config.HEARTBEAT_MAX_WAIT)
+        except ValueError:
+            wait = 0
+        self.set_etag_header()
+        if wait > 0 and self.check_etag_header():
+            try:
+                await self.changed.wait(timedelta(seconds=wait))
+            except TimeoutError:
+                ...
+            body, self.etag = settings.heartbeat()
+            self.set_etag_header()
+        self.set_header('Cache-Control', 'no-cache')
+        # 已经设置了Etag头, finish()不会再自动返回304
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+        self.set_header('Content-Type', 'application/json')
+        self.write(body)
+
+
+settings.subscribe(HeartbeatHandler.notify)
+
+
+def session_principal(app: Flask, request: HTTPServerRequest) -> Principal:
+    """从Flask的会话中取得当前用户, 会话存储可能访问数据库, 应在线程池中调用"""
+    # 会话只依赖cookie
+    environ = EnvironBuilder(
+        headers={'Cookie': request.headers.get('Cookie', '')}
+    ).get_environ()
+    return Principal.from_session(
+        app.session_interface.open_session(app, Request(environ)))
+
+
+Topics = Callable[[HTTPServerRequest], list[str] | None]
+
+
+def session_topics(app: Flask) -> Topics:
+    """根据请求的会话决定订阅的主题, 未登录时返回None"""
+    def topics(request: HTTPServerRequest) -> list[str] | None:
+        if not (principal := session_principal(app, request)).authenticated:
+            return None
+        return [
+            'school',
+            'toolkit',
+            f'user:{principal.userid}',
+            f'class:{principal.classid}'
+        ]
+    return topics
+
+
+class EventsHandler(RequestHandler):
+    """
+    /events: Server-Sent Events推送通知和工具箱状态.
+    每个连接只占用一个队列和几个回调, 不占用线程
+    """
+
+    def initialize(self, topics: Topics) -> None:
+        self.topics = topics
+        self.queue: Queue = Queue(config.EVENTS_QUEUE_SIZE)
+
+    def push(self, event: str, data: str) -> None:
+        try:
+            self.queue.put_nowait((event, data))
+        except QueueFull:
+            # 客户端太慢, 丢弃
+            ...
+
+    def on_connection_close(self) -> None:
+        self.push(None, None)
+
+    async def get(self) -> None:
+        io_loop = IOLoop.current()
+        topics = await io_loop.run_in_executor(
+            None, self.topics, self.request)
+        if topics is None:
+            self.set_status(403)
+            return
+        unsubscribe = broker.subscribe(
+            topics,
+            lambda event, data: io_loop.add_callback(self.push, event, data)
+        )
+        self.set_header('Content-Type', 'text/event-stream')
+        self.set_header('Cache-Control', 'no-cache')
+        # 让nginx等反向代理不要缓冲
+        self.set_header('X-Accel-Buffering', 'no')
+        try:
+            self.write(f'retry: {config.EVENTS_RETRY * 1000}\n\n')
+            await self.flush()
+            while True:
+                try:
+                    event, data = await self.queue.get(
+                        timedelta(seconds=config.EVENTS_KEEPALIVE))
+                except TimeoutError:
+                    # 注释行, 用于保持连接和发现断开的客户端
+                    self.write(': keepalive\n\n')
+                else:
+                    if event is None:
+                        break
+                    self.write(f'event: {event}\ndata: {data}\n\n')
+                await self.flush()
+        except StreamClosedError:
+            ...
+        finally:
+            unsubscribe()
+
+
+CORS_METHODS = 'DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT'
+
+
+class ApiHandler(RequestHandler):
+    """
+    在tornado中直接提供只读的json接口, 数据库操作在有界的线程池中进行.
+    慢客户端只占用连接, 不占用线程; 排队的请求过多时返回503.
+    CORS头和压缩与经过Flask的接口相同
+    """
+    executor = ThreadPoolExecutor(config.API_THREADS, thread_name_prefix='zvms-api')
+    pending = 0
+
+    def initialize(self, app: Flask, api: Api, fn: Callable) -> None:
+        self.app = app
+        self.api = api
+        self.fn = fn
+        self.etag: str | None = None
+
+    def set_default_headers(self) -> None:
+        # 与zvms/__init__.py中的CORS(app, supports_credentials=...)相同
+        if (origin := self.request.headers.get('Origin')) is not None:
+            self.set_header('Access-Control-Allow-Origin', origin)
+            self.set_header('Access-Control-Allow-Credentials', 'true')
+            self.set_header('Vary', 'Origin')
+
+    def options(self, **kwargs) -> None:
+        self.set_header('Allow', 'HEAD, GET, OPTIONS')
+        if 'Origin' not in self.request.headers:
+            return
+        self.set_header('Access-Control-Allow-Methods', CORS_METHODS)
+        if (headers := self.request.headers.get('Access-Control-Request-Headers')):
+            self.set_header('Access-Control-Allow-Headers', headers)
+
+    def compute_etag(self) -> str | None:
+        return None if self.etag is None else f'"{self.etag}"'
+
+    def authenticate(self, kwargs: dict) -> Principal:
+        principal = session_principal(self.app, self.request)
+        if principal.authenticated and self.api.version is not None:
+            with self.app.app_context(), principal.bind():
+                self.etag = version_etag(self.api.name, self.api.version(**kwargs))
+        return principal
+
+    def call(self, principal: Principal, kwargs: dict) -> str:
+        with self.app.app_context(), principal.bind():
+            try:
+                ret = {'errorn': ErrorCode.NO_ERROR, 'data': self.fn(**kwargs)}
+            except ZvmsError as exn:
+                self.etag = None
+                errorn, *info = exn.args
+                ret = {'errorn': errorn, **(info[0] if info else {})}
+        return json.dumps(ret)
+
+    async def get(self, **kwargs) -> None:
+        if ApiHandler.pending >= config.API_MAX_PENDING:
+            self.set_header('Retry-After', '1')
+            self.send_error(503)
+            return
+        kwargs = {
+            name: int(value) if self.api.url.params[name] == 'number' else value
+            for name, value in kwargs.items()
+        }
+        io_loop = IOLoop.current()
+        ApiHandler.pending += 1
+        try:
+            principal = await io_loop.run_in_executor(
+                self.executor, self.authenticate, kwargs)
+            if not principal.authenticated or (
+                self.api.permission is not None
+                and not self.api.permission.authorized(principal.permission)
+            ):
+                self.send_error(403)
+                return
+            if self.etag is not None:
+                # 与framework.route相同
+                self.set_header('Cache-Control', 'private, no-cache')
+                self.set_etag_header()
+                if self.check_etag_header():
+                    self.set_status(304)
+                    return
+            body = await io_loop.run_in_executor(
+                self.executor, self.call, principal, kwargs)
+        except HTTPException as exn:
+            # 如内核中的abort(404)
+            self.send_error(exn.code or 500)
+            return
+        finally:
+            ApiHandler.pending -= 1
+        self.set_header('Content-Type', 'application/json')
+        self.set_header('Vary', ', '.join(
+            filter(None, (self._headers.get('Vary'), 'Accept-Encoding'))))
+        compress: CompressMiddleware = self.app.extensions['compress']
+        encoding, body = compress.encode(
+            self.request.headers.get('Accept-Encoding', ''), body.encode())
+        if encoding is not None:
+            self.set_header('Content-Encoding', encoding)
+            if self.etag is not None:
+                # 与CompressMiddleware相同, 压缩后只能是弱ETag
+                self.set_header('Etag', f'W/"{self.etag}"')
+        self.write(body)
+
+
+def api_handlers(app: Flask, prefix: str, views: list[Callable]) -> list[tuple]:
+    """
+    把用api_route定义的GET接口交给ApiHandler.
+    接口必须需要登录, 且只读, 除URL参数外没有其他参数
+    """
+    routes = []
+    for view in views:
+        api: Api = view.__api__
+        pattern = re.sub(
+            r'<(int:)?(\w+)>',
+            lambda m: f'(?P<{m[2]}>{"[0-9]+" if m[1] else "[^/]+"})',
+            api.url.string
+        )
+        routes.append((
+            prefix + api.blueprint.url_prefix + pattern + '$',
+            ApiHandler,
+            {'app': app, 'api': api, 'fn': unwrap(view)}
+        ))
+    return routes
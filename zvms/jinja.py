@@ -0,0 +1,71 @@
+from time import perf_counter
+import threading
+import os
+
+from flask import Flask, before_render_template, template_rendered
+from jinja2 import FileSystemBytecodeCache
+
+from .misc import logger
+
+
+class RenderTimings:
+    """按模板统计渲染耗时, 第一次渲染(冷启动)单独记录"""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        # 模板名 -> [首次耗时, 次数, 总耗时, 最大耗时]
+        self.stats: dict[str, list[float]] = {}
+
+    def start(self, sender, template, context, **extra) -> None:
+        self.local.__dict__.setdefault('stack', []).append(perf_counter())
+
+    def stop(self, sender, template, context, **extra) -> None:
+        elapsed = perf_counter() - self.local.stack.pop()
+        with self.lock:
+            match self.stats.get(template.name):
+                case None:
+                    self.stats[template.name] = [elapsed, 1, elapsed, elapsed]
+                case stat:
+                    stat[1] += 1
+                    stat[2] += elapsed
+                    stat[3] = max(stat[3], elapsed)
+        if elapsed > sender.config['TEMPLATE_SLOW_RENDER']:
+            logger.warning(
+                f'Rendering {template.name} took {elapsed * 1000:.1f} ms.')
+
+    def summary(self) -> list[tuple[str, float, int, float, float]]:
+        """(模板名, 首次耗时, 次数, 平均耗时, 最大耗时), 按总耗时降序"""
+        with self.lock:
+            return [
+                (name, first, count, total / count, peak)
+                for name, (first, count, total, peak) in sorted(
+                    self.stats.items(), key=lambda item: -item[1][2])
+            ]
+
+
+timings = RenderTimings()
+
+
+def init_templates(app: Flask) -> None:
+    if app.config['TEMPLATE_BYTECODE_CACHE']:
+        directory = os.path.join(
+            app.instance_path, app.config['TEMPLATE_BYTECODE_CACHE'])
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+    before_render_template.connect(timings.start, app)
+    template_rendered.connect(timings.stop, app)
+
+
+def warm_up(app: Flask) -> int:
+    """编译所有模板, 有字节码缓存时只需要读取缓存; 返回模板数量"""
+    started = perf_counter()
+    names = app.jinja_env.list_templates(extensions=['html'])
+    for name in names:
+        try:
+            app.jinja_env.get_template(name)
+        except Exception as exn:
+            logger.warning(f'Cannot compile {name}: {exn}')
+    logger.info(
+        f'{len(names)} templates compiled in {(perf_counter() - started) * 1000:.0f} ms.')
+    return len(names)
@@ -4,10 +4,13 @@ from operator import or_
 from flask import session
 
 from ..framework import ZvmsError
-from ..misc import ErrorCode, Permission
+from ..misc import ErrorCode, Permission, forget_principal
 from ..util import execute_sql
+from ..session import revoke_sessions
+from ..cache import invalidates, USER
 
 
+@invalidates(USER)
 def alter_permission(userident: str, perm: list[int]) -> int:
     match execute_sql(
         'SELECT userid, permission FROM user '
@@ -27,6 +30,7 @@ def alter_permission(userident: str, perm: list[int]) -> int:
         perm=reduce(or_, perm, 0),
         userid=userid
     )
+    revoke_sessions(userid)
     return userid
 
 
@@ -46,3 +50,4 @@ def login(userident: str) -> None:
         ('userid', 'username', 'permission', 'classid'),
         user_info
     )))
+    forget_principal()
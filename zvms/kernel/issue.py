@@ -1,7 +1,6 @@
-from flask import session
-
 from ..framework import ZvmsError
 from ..util import execute_sql, inexact_now
+from ..misc import principal
 
 
 def list_issues() -> list[tuple[int, str, str, str]]:
@@ -18,13 +17,13 @@ def my_issues() -> tuple[int, list[tuple[str, str]]]:
         'SELECT time, content '
         'FROM issue '
         'WHERE author = :author',
-        author=session.get('userid')
+        author=principal.userid
     ).fetchall()
     issues_today = execute_sql(
         'SELECT COUNT(*) '
         'FROM issue '
         'WHERE author = :author AND time > DATE("NOW")',
-        author=session.get('userid')
+        author=principal.userid
     ).fetchone()[0]
     return issues_today, issues_posted
 
@@ -34,14 +33,14 @@ def post_issue(content: str) -> None:
         'SELECT COUNT(*) '
         'FROM issue '
         'WHERE author = :id AND time > DATE("NOW")',
-        id=session.get('userid'),
+        id=principal.userid,
     ).fetchone()[0]
     if times >= 5:
         raise ZvmsError('反馈已达上限')
     execute_sql(
         'INSERT INTO issue(author, content, time) '
         'VALUES(:author, :content, :time)',
-        author=session.get('userid'),
+        author=principal.userid,
         content=content,
         time=inexact_now()
     )
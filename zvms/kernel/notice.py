@@ -1,26 +1,32 @@
+from collections import defaultdict
 from datetime import date
 
-from flask import session
-
 from ..framework import ZvmsError
 from ..util import (
     username2userid,
     get_primary_key,
+    execute_many,
     execute_sql
 )
+from ..cache import invalidates, bump, NOTICE
+from ..pubsub import publish_after_commit
+from .user import get_classes
 from ..misc import (
     Permission,
-    ErrorCode
+    ErrorCode,
+    principal,
+    db
 )
 
 
+@invalidates(NOTICE)
 def send_school_notice(
     title: str,
     content: str,
     anonymous: str,
     expire: date
 ) -> None:
-    sender = 0 if anonymous else session.get('userid')
+    sender = 0 if anonymous else principal.userid
     execute_sql(
         'INSERT INTO notice(title, content, sender, school, expire) '
         'VALUES(:title, :content, :sender, TRUE, :expire)',
@@ -29,17 +35,39 @@ def send_school_notice(
         sender=sender,
         expire=expire
     )
+    publish_after_commit('school', 'notice', {'title': title})
+
+
+def resolve_classes(classes: list[int], grades: list[int]) -> set[int]:
+    """班级和年级(班级ID去掉后两位, 如2022)展开为班级ID"""
+    known = {id for id, _ in get_classes()}
+    for classid in classes:
+        if classid not in known:
+            raise ZvmsError(ErrorCode.CLASS_NOT_EXISTS, {'classid': classid})
+    ret = set(classes)
+    for grade in grades:
+        if not (members := {id for id in known if id and id // 100 == grade}):
+            raise ZvmsError(ErrorCode.CLASS_NOT_EXISTS, {'classid': grade})
+        ret |= members
+    return ret
 
 
+@invalidates(NOTICE)
 def send_notice(
     title: str,
     content: str,
     anonymous: bool,
     targets: list[str],
-    expire: date
+    expire: date,
+    classes: list[int] = [],
+    grades: list[int] = []
 ) -> None:
-    sender = 0 if anonymous else session.get('userid')
+    """targets为用户名或学号; 发送给班级或年级时每个班级只插入一行"""
+    sender = 0 if anonymous else principal.userid
     userids = username2userid(targets)
+    classids = resolve_classes(classes, grades)
+    if not userids and not classids:
+        raise ZvmsError(ErrorCode.VALIDATION_FAILS)
     execute_sql(
         'INSERT INTO notice(title, content, sender, school, expire) '
         'VALUES(:title, :content, :sender, FALSE, :expire)',
@@ -49,13 +77,28 @@ def send_notice(
         expire=expire
     )
     noticeid = get_primary_key()
+    _add_targets(noticeid, title, set(userids))
+    _add_class_targets(noticeid, title, classids)
+
+
+def _add_targets(noticeid: int, title: str, userids: set[int]) -> None:
+    execute_many(
+        'INSERT INTO user_notice(userid, noticeid) '
+        'VALUES(:userid, :noticeid)',
+        [{'userid': userid, 'noticeid': noticeid} for userid in userids]
+    )
     for userid in userids:
-        execute_sql(
-            'INSERT INTO user_notice(userid, noticeid) '
-            'VALUES(:userid, :noticeid)',
-            userid=userid,
-            noticeid=noticeid
-        )
+        publish_after_commit(f'user:{userid}', 'notice', {'title': title})
+
+
+def _add_class_targets(noticeid: int, title: str, classids: set[int]) -> None:
+    execute_many(
+        'INSERT INTO class_notice(classid, noticeid) '
+        'VALUES(:classid, :noticeid)',
+        [{'classid': classid, 'noticeid': noticeid} for classid in classids]
+    )
+    for classid in classids:
+        publish_after_commit(f'class:{classid}', 'notice', {'title': title})
 
 
 def my_notices() -> list[tuple[str, str, str, int, str]]:
@@ -72,48 +115,74 @@ def my_notices() -> list[tuple[str, str, str, int, str]]:
         'FROM class_notice '
         'WHERE classid = :classid)) '
         'ORDER BY notice.id DESC',
-        userid=session.get('userid'),
-        classid=session.get('classid')
+        userid=principal.userid,
+        classid=principal.classid
     ).fetchall()
 
 
-def list_notices() -> list[tuple[
+def list_notices(page: int) -> tuple[int, list[tuple[
     int,  # ID
     str,  # 标题
     str,  # 内容
     str,  # 过期时间
     int,  # 发送者ID
     str,  # 发送者用户名
-    list[tuple[int, str]]  # 目标
-]]:
-    return [
-        (id, title, content, expire, senderid, sender, targets)
-        for id, title, content, expire, school, senderid, sender in execute_sql(
-            'SELECT notice.id, notice.title, notice.content, notice.expire, notice.school, user.userid, user.username '
-            'FROM notice '
-            'JOIN user ON user.userid = notice.sender '
-            'WHERE {} '
-            'ORDER BY notice.id DESC'.format(
-                'TRUE' if Permission.ADMIN.authorized() else 'notice.sender = :sender'
-            ),
-            sender=session.get('userid')
-        ).fetchall()
-        if (targets := execute_sql(
-            'SELECT user.userid, user.username '
+    list[tuple[int, str]],  # 目标
+    list[tuple[int, str]]  # 目标班级
+]]]:
+    where = 'TRUE' if Permission.ADMIN.authorized() else 'notice.sender = :sender'
+    count = execute_sql(
+        f'SELECT COUNT(*) FROM notice WHERE {where}',
+        sender=principal.userid
+    ).scalar()
+    notices = execute_sql(
+        'SELECT notice.id, notice.title, notice.content, notice.expire, notice.school, user.userid, user.username '
+        'FROM notice '
+        'JOIN user ON user.userid = notice.sender '
+        f'WHERE {where} '
+        'ORDER BY notice.id DESC '
+        'LIMIT 10 '
+        'OFFSET :offset',
+        sender=principal.userid,
+        offset=page * 10
+    ).fetchall()
+    # 一次查出这一页所有通知的目标
+    targets = defaultdict(list)
+    classes = defaultdict(list)
+    if noticeids := [id for id, _, _, _, school, _, _ in notices if not school]:
+        for noticeid, userid, username in execute_sql(
+            'SELECT un.noticeid, user.userid, user.username '
             'FROM user_notice AS un '
             'JOIN user ON user.userid = un.userid '
-            'WHERE noticeid = :noticeid',
-            noticeid=id
-        ).fetchall() if not school else []) or True
+            'WHERE un.noticeid IN :noticeids',
+            noticeids=noticeids
+        ):
+            targets[noticeid].append((userid, username))
+        for noticeid, classid, name in execute_sql(
+            'SELECT cn.noticeid, class.id, class.name '
+            'FROM class_notice AS cn '
+            'JOIN class ON class.id = cn.classid '
+            'WHERE cn.noticeid IN :noticeids '
+            'ORDER BY class.id',
+            noticeids=noticeids
+        ):
+            classes[noticeid].append((classid, name))
+    return count, [
+        (id, title, content, expire, senderid, sender, targets[id], classes[id])
+        for id, title, content, expire, _, senderid, sender in notices
     ]
 
 
+@invalidates(NOTICE)
 def edit_notice(
     noticeid: int,
     title: str,
     content: str,
-    targets: list[str]
+    targets: list[str],
+    classes: list[int] | None = None,
+    grades: list[int] = []
 ) -> None:
+    """targets为空时不修改用户目标, classes为None且grades为空时不修改班级目标"""
     if execute_sql(
         'SELECT id FROM notice WHERE id = :id',
             id=noticeid).fetchone() is None:
@@ -125,18 +194,33 @@ def edit_notice(
         except ValueError as exn:
             raise ZvmsError(ErrorCode.USER_NOT_EXISTS,
                             {'userid': exn.args[0]})
-        execute_sql(
-            'DELETE FROM user_notice '
-            'WHERE noticeid = :noticeid',
+        # 只删除被去掉的目标, 只插入新的目标
+        current = set(execute_sql(
+            'SELECT userid FROM user_notice WHERE noticeid = :noticeid',
+            noticeid=noticeid
+        ).scalars())
+        if removed := list(current - set(userids)):
+            execute_sql(
+                'DELETE FROM user_notice '
+                'WHERE noticeid = :noticeid AND userid IN :removed',
+                noticeid=noticeid,
+                removed=removed
+            )
+        _add_targets(noticeid, title, set(userids) - current)
+    if classes is not None or grades:
+        classids = resolve_classes(classes or [], grades)
+        current = set(execute_sql(
+            'SELECT classid FROM class_notice WHERE noticeid = :noticeid',
             noticeid=noticeid
-        )
-        for userid in userids:
+        ).scalars())
+        if removed := list(current - classids):
             execute_sql(
-                'INSERT INTO user_notice(userid, noticeid) '
-                'VALUES(:userid, :noticeid)',
-                userid=userid,
-                noticeid=noticeid
+                'DELETE FROM class_notice '
+                'WHERE noticeid = :noticeid AND classid IN :removed',
+                noticeid=noticeid,
+                removed=removed
             )
+        _add_class_targets(noticeid, title, classids - current)
     execute_sql(
         'UPDATE notice '
         'SET title = :title, content = :content '
@@ -147,6 +231,7 @@ def edit_notice(
     )
 
 
+@invalidates(NOTICE)
 def delete_notice(noticeid: int) -> None:
     execute_sql('DELETE FROM user_notice WHERE noticeid = :noticeid',
                 noticeid=noticeid)
@@ -159,3 +244,40 @@ def delete_notice(noticeid: int) -> None:
         raise ZvmsError(ErrorCode.NOTICE_NOT_EXISTS,
                         {'noticeid': noticeid})
     execute_sql('DELETE FROM notice WHERE id = :id', id=noticeid)
+
+
+def archive_notices(retention: int, batch: int = 500) -> int:
+    """
+    把过期超过retention天的通知及其目标移入归档表, 每批一个事务.
+    返回归档的数量
+    """
+    archived = 0
+    while (last := execute_sql(
+        'SELECT MAX(id) FROM (SELECT id FROM notice '
+        'WHERE expire < DATE("NOW", :offset) ORDER BY id LIMIT :batch)',
+        offset=f'-{retention} days',
+        batch=batch
+    ).scalar()) is not None:
+        expired = dict(offset=f'-{retention} days', last=last)
+        condition = 'expire < DATE("NOW", :offset) AND id <= :last'
+        archived += execute_sql(
+            'INSERT OR IGNORE INTO notice_archive(id, title, content, sender, school, expire) '
+            f'SELECT id, title, content, sender, school, expire FROM notice WHERE {condition}',
+            **expired
+        ).rowcount
+        for table, column in (('user_notice', 'userid'), ('class_notice', 'classid')):
+            execute_sql(
+                f'INSERT OR IGNORE INTO {table}_archive({column}, noticeid) '
+                f'SELECT {column}, noticeid FROM {table} '
+                f'WHERE noticeid IN (SELECT id FROM notice WHERE {condition})',
+                **expired
+            )
+            execute_sql(
+                f'DELETE FROM {table} '
+                f'WHERE noticeid IN (SELECT id FROM notice WHERE {condition})',
+                **expired
+            )
+        execute_sql(f'DELETE FROM notice WHERE {condition}', **expired)
+        bump(NOTICE)
+        db.session.commit()
+    return archived
@@ -1,19 +1,28 @@
-from typing import TypeAlias
-import os.path
+from typing import TypeAlias, BinaryIO
 
-from flask import abort, session
+from flask import abort
 
 from ..framework import ZvmsError
 from ..util import (
     send_notice_to,
-    execute_sql,
-    md5
+    execute_many,
+    execute_sql
+)
+from ..pictures import (
+    discard_picture,
+    commit_picture,
+    stage_picture
+)
+from ..cache import (
+    invalidates,
+    THOUGHT
 )
 from ..misc import (
     ThoughtStatus,
     Permission,
     ErrorCode,
-    VolType
+    VolType,
+    principal
 )
 
 SelectResult: TypeAlias = tuple[
@@ -62,7 +71,7 @@ def my_thoughts(page: int) -> SelectResult:
     return _select_thoughts(
         'uv.userid = :userid',
         {
-            'userid': session.get('userid')
+            'userid': principal.userid
         },
         page
     )
@@ -103,8 +112,8 @@ def thought_info(volid: int, userid: int) -> tuple[
         case None:
             abort(404)
         case [username, classid, *spam]: ...
-    if userid != int(session.get('userid')) and not (
-        (Permission.CLASS.authorized() and classid != int(session.get('classid'))) or
+    if userid != principal.userid and not (
+        (Permission.CLASS.authorized() and classid != principal.classid) or
         (Permission.MANAGER | Permission.AUDITOR).authorized()
     ):
         raise ZvmsError(ErrorCode.NOT_AUTHORIZED)
@@ -122,7 +131,7 @@ def prepare_edit_thought(volid: int, userid: int) -> tuple[
     str,  # 感想
     list[tuple[str, bool]]  # 图片
 ]:
-    if userid != int(session.get('userid')):
+    if userid != principal.userid:
         raise ZvmsError(ErrorCode.CANT_EDIT_OTHERS_THOUGHT)
     match execute_sql(
         'SELECT vol.name, uv.status, uv.thought '
@@ -157,18 +166,16 @@ def prepare_edit_thought(volid: int, userid: int) -> tuple[
     return volname, status, thought, pictures
 
 
+@invalidates(THOUGHT)
 def edit_thought(
     volid: int,
     userid: int,
     thought: str,
     pictures: list[str],
-    files: list[tuple[
-        str,
-        bytes
-    ]],
+    files: list[BinaryIO],
     submit: bool
 ) -> None:
-    if userid != int(session.get('userid')):
+    if userid != principal.userid:
         raise ZvmsError(ErrorCode.CANT_EDIT_OTHERS_THOUGHT)
     match execute_sql(
         'SELECT status FROM user_vol WHERE userid = :userid AND volid = :volid',
@@ -183,60 +190,40 @@ def edit_thought(
         case [ThoughtStatus.DRAFT] if submit: ...
         case _:
             raise ZvmsError(ErrorCode.THOUGHT_NOT_EDITABLE)
-    execute_sql(
-        'DELETE FROM picture WHERE volid = :volid AND userid = :userid',
+    existing = set(execute_sql(
+        'SELECT DISTINCT filename FROM picture '
+        'WHERE volid = :volid AND filename IN :filenames',
         volid=volid,
-        userid=userid
-    )
+        filenames=pictures
+    ).scalars().all())
     for filename in pictures:
-        if execute_sql(
-            'SELECT COUNT(*) FROM picture WHERE volid = :volid AND filename = :filename',
-            volid=volid,
-            filename=filename
-        ).fetchone()[0] == 0:
+        if filename not in existing:
             raise ZvmsError(ErrorCode.PICTURE_NOT_EXISTS,
                             {'filename': filename})
+    staged = []
+    try:
+        for stream in files:
+            staged.append(stage_picture(stream))
         execute_sql(
-            'INSERT INTO picture(volid, userid, filename) '
-            'VALUES(:volid, :userid, :filename)',
+            'DELETE FROM picture WHERE volid = :volid AND userid = :userid',
             volid=volid,
-            userid=userid,
-            filename=filename
+            userid=userid
         )
-    for filename, data in files:
-        try:
-            data.decode()
-        except UnicodeEncodeError: ...
-        else:
-            raise ZvmsError(ErrorCode.INVALID_IMAGE_FILE)
-        ext = filename.split('.')[-1]
-        filename = f'{md5(data)}.{ext}'
-        match execute_sql(
-            'SELECT * FROM picture '
-            'WHERE volid = :volid AND userid = :userid AND filename = :filename',
-            volid=volid,
-            userid=userid,
-            filename=filename
-        ).fetchone():
-            case None: ...
-            case _:
-                continue
-        execute_sql(
+        execute_many(
             'INSERT INTO picture(volid, userid, filename) '
             'VALUES(:volid, :userid, :filename)',
-            volid=volid,
-            userid=userid,
-            filename=filename
+            [
+                {'volid': volid, 'userid': userid, 'filename': filename}
+                for filename in dict.fromkeys(
+                    pictures + [filename for filename, _ in staged]
+                )
+            ]
         )
-        match execute_sql(
-            'SELECT COUNT(*) FROM picture WHERE filename = :filename',
-            filename=filename
-        ).fetchone():
-            case [1]: ...
-            case _:
-                continue
-        with open(os.path.join('zvms', 'static', 'pictures', filename), 'wb') as f:
-            f.write(data)
+        while staged:
+            commit_picture(*staged.pop())
+    finally:
+        for _, temp in staged:
+            discard_picture(temp)
     if submit:
         execute_sql(
             'UPDATE user_vol SET thought = :thought, status = :status '
@@ -256,6 +243,7 @@ def edit_thought(
         )
 
 
+@invalidates(THOUGHT)
 def first_audit(volid: int, userid: int) -> None:
     match execute_sql(
         'SELECT status FROM user_vol WHERE userid = :userid AND volid = :volid',
@@ -296,6 +284,7 @@ def _test_final(volid: int, userid: int) -> None:
             raise ZvmsError(ErrorCode.THOUGHT_NOT_AUDITABLE)
 
 
+@invalidates(THOUGHT)
 def accept_thought(volid: int, userid: int, reward: int) -> None:
     _test_final(volid, userid)
     execute_sql(
@@ -333,6 +322,7 @@ def _reject_or_spike(
     )
 
 
+@invalidates(THOUGHT)
 def reject_thought(volid: int, userid: int) -> None:
     _reject_or_spike(
         volid,
@@ -342,6 +332,7 @@ def reject_thought(volid: int, userid: int) -> None:
     )
 
 
+@invalidates(THOUGHT)
 def spike_thought(volid: int, userid: int) -> None:
     _reject_or_spike(
         volid,
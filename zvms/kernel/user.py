@@ -2,28 +2,49 @@ from flask import abort, session
 
 from ..framework import ZvmsError
 from ..util import execute_sql
+from ..ratelimit import check_login_rate
+from ..cache import references, USER
+from ..password import (
+    verify_password,
+    hash_password,
+    needs_rehash
+)
 from ..misc import (
     Permission,
-    ErrorCode
+    ErrorCode,
+    forget_principal,
+    principal
 )
 
 
 def login(userident: str, password: str) -> tuple[int, str, int, int]:
-    info = execute_sql(
-        'SELECT userid, username, permission, classid '
+    match execute_sql(
+        'SELECT userid, username, permission, classid, password '
         'FROM user '
-        'WHERE {} = :userident AND password = :password'.format(
+        'WHERE {} = :userident'.format(
             'userid' if userident.isdecimal() else 'username'
         ),
-        userident=userident,
-        password=password
-    ).fetchone()
-    if info is None:
-        raise ZvmsError(ErrorCode.INCORRECT_USERNAME_OR_PASSWORD)
+        userident=userident
+    ).fetchone():
+        case None:
+            check_login_rate(userident)
+            raise ZvmsError(ErrorCode.INCORRECT_USERNAME_OR_PASSWORD)
+        case [userid, username, permission, classid, stored]:
+            check_login_rate(str(userid))
+            if not verify_password(password, stored):
+                raise ZvmsError(ErrorCode.INCORRECT_USERNAME_OR_PASSWORD)
+    if needs_rehash(stored):
+        execute_sql(
+            'UPDATE user SET password = :password WHERE userid = :userid',
+            password=hash_password(password),
+            userid=userid
+        )
+    info = userid, username, permission, classid
     session.update(dict(zip(
         ('userid', 'username', 'permission', 'classid'),
         info
     )))
+    forget_principal()
     return info
 
 
@@ -41,28 +62,25 @@ def user_info(userid: int) -> tuple[str, int, int, str]:
 
 def modify_password(target: int, old: str, new: str) -> None:
     manager = Permission.MANAGER.authorized()
-    if target != int(session.get('userid')) and not manager:
+    if target != principal.userid and not manager:
         raise ZvmsError(ErrorCode.NOT_AUTHORIZED)
     match execute_sql(
-        'SELECT permission FROM user WHERE userid = :userid',
+        'SELECT permission, password FROM user WHERE userid = :userid',
         userid=target
     ).fetchone():
         case None:
             raise ZvmsError(ErrorCode.USER_NOT_EXISTS, {'userid': target})
-        case [perm] if perm & Permission.ADMIN and target != int(session.get('userid')):
+        case [perm, _] if perm & Permission.ADMIN and target != principal.userid:
             raise ZvmsError(ErrorCode.NOT_AUTHORIZED)
-    if not manager and execute_sql(
-        'SELECT * FROM user WHERE userid = :userid AND password = :password',
-        userid=target,
-        password=old
-    ):
+        case [_, stored]: ...
+    if not manager and not verify_password(old, stored):
         raise ZvmsError(ErrorCode.INCORRECT_OLD_PASSWORD)
     execute_sql(
         'UPDATE user '
         'SET password = :password '
         'WHERE userid = :userid',
         userid=target,
-        password=new
+        password=hash_password(new)
     )
 
 
@@ -77,10 +95,37 @@ def get_time_sums(userid: int) -> dict[int, int]:
     ).fetchall())
 
 
+def get_all_time_sums() -> dict[int, dict[int, int]]:
+    sums = {}
+    for userid, type, reward in execute_sql(
+        'SELECT uv.userid, vol.type, SUM(uv.reward) '
+        'FROM user_vol AS uv '
+        'JOIN volunteer AS vol ON vol.id = uv.volid '
+        'WHERE uv.status = 5 '
+        'GROUP BY uv.userid, vol.type'
+    ):
+        sums.setdefault(userid, {})[type] = reward
+    return sums
+
+
+reference = references[USER].cached
+
+
+@reference
 def get_classes() -> list[tuple[int, str]]:
-    return execute_sql('SELECT id, name FROM class').fetchall()
+    return list(map(tuple, execute_sql('SELECT id, name FROM class').fetchall()))
+
+
+@reference
+def user_index() -> tuple[
+    dict[str, int],  # 用户名 -> 用户ID
+    frozenset[int]  # 所有用户ID
+]:
+    users = execute_sql('SELECT username, userid FROM user').fetchall()
+    return dict(users), frozenset(userid for _, userid in users)
 
 
+@reference
 def class_info(classid: int) -> tuple[str, list[tuple[int, str]]]:
     match execute_sql(
         'SELECT name FROM class '
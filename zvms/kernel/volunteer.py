@@ -6,7 +6,7 @@ from typing import (
 from operator import itemgetter
 from datetime import date
 
-from flask import abort, session
+from flask import abort
 
 from ..framework import ZvmsError
 from ..util import (
@@ -15,13 +15,19 @@ from ..util import (
     send_notice_to,
     execute_sql
 )
+from ..cache import (
+    invalidates,
+    THOUGHT,
+    VOLUNTEER
+)
 from ..misc import (
     ThoughtStatus,
     Permission,
     ErrorCode,
     VolStatus,
     VolKind,
-    VolType
+    VolType,
+    principal
 )
 
 SelectResult: TypeAlias = tuple[
@@ -76,9 +82,9 @@ def _can_signup(volid: int) -> bool:
         'AND uv.userid IN (SELECT user.userid FROM user WHERE user.classid = cv.classid) '
         'JOIN volunteer AS vol ON vol.id = cv.volid '
         'WHERE vol.id = :volid',
-        userid=session.get('userid'),
+        userid=principal.userid,
         volid=volid,
-        classid=session.get('classid')
+        classid=principal.classid
     ).fetchone()[0]
 
 
@@ -112,8 +118,8 @@ def my_volunteers(page: int) -> SelectResult:
             else ''
         ),
         {
-            'userid': session.get('userid'),
-            'classid': session.get('classid')
+            'userid': principal.userid,
+            'classid': principal.classid
         },
         page
     )
@@ -148,11 +154,11 @@ def volunteer_info(volid: int) -> tuple[
         'JOIN user ON user.userid = uv.userid '
         'WHERE uv.volid = :volid AND uv.status != 1 ',
         volid=volid,
-        userid=session.get('userid'),
+        userid=principal.userid,
         can_view_thoughts=(Permission.MANAGER |
                            Permission.AUDITOR).authorized(),
         can_view_class_thoughts=Permission.CLASS.authorized(),
-        classid=session.get('classid')
+        classid=principal.classid
     ).fetchall()
     signups = []
     if Permission.CLASS.authorized():
@@ -188,6 +194,7 @@ def _volunteer_helper_post(volid: int, classes: Classes) -> None:
         )
 
 
+@invalidates(VOLUNTEER)
 def create_volunteer(
     name: str,
     description: str,
@@ -204,7 +211,7 @@ def create_volunteer(
         type=VolType.INSIDE,
         status=VolStatus.ACCEPTED if (
             Permission.CLASS | Permission.MANAGER).authorized() else VolStatus.UNAUDITED,
-        holder=session.get('userid'),
+        holder=principal.userid,
         reward=reward,
         time=time
     )
@@ -220,6 +227,7 @@ def create_volunteer(
     return volid
 
 
+@invalidates(VOLUNTEER, THOUGHT)
 def create_appointed_volunteer(
     name: str,
     description: str,
@@ -242,7 +250,7 @@ def create_appointed_volunteer(
         name=name,
         description=description,
         status=status,
-        holder=session.get('userid'),
+        holder=principal.userid,
         type=type,
         reward=reward
     )
@@ -258,14 +266,14 @@ def create_appointed_volunteer(
     if to_send_notice:
         match execute_sql(
             'SELECT userid FROM user WHERE classid = :classid AND permission & 1',
-            classid=session.get('classid')
+            classid=principal.classid
         ).fetchone():
             case [secretary]:
                 send_notice_to(
                     '义工创建',
                     '你班级的同学[{}](/user/{})创建了义工[{}](/volunteer/{}), 请择日加以审核'.format(
-                        session.get('username'),
-                        session.get('userid'),
+                        principal.username,
+                        principal.userid,
                         name,
                         volid
                     ),
@@ -274,6 +282,7 @@ def create_appointed_volunteer(
     return volid
 
 
+@invalidates(VOLUNTEER, THOUGHT)
 def audit_volunteer(
     volid: int,
     status: Literal[VolStatus.ACCEPTED, VolStatus.REJECTED]
@@ -320,6 +329,7 @@ def audit_volunteer(
             )
 
 
+@invalidates(VOLUNTEER, THOUGHT)
 def create_special_volunteer(
     name: str,
     type: VolType,
@@ -332,7 +342,7 @@ def create_special_volunteer(
         'VALUES(:name, :name, :status, :holder, DATE("NOW"), :type, :reward)',
         name=name,
         status=VolStatus.SPECIAL,
-        holder=session.get('userid'),
+        holder=principal.userid,
         type=type,
         reward=reward
     )
@@ -354,6 +364,7 @@ def create_special_volunteer(
     return volid
 
 
+@invalidates(VOLUNTEER, THOUGHT)
 def create_special_volunteer_ex(
     name: str,
     type: VolType,
@@ -365,7 +376,7 @@ def create_special_volunteer_ex(
         'VALUES(:name, :name, :status, :holder, DATE("NOW"), :type, 0)',
         name=name,
         status=VolStatus.SPECIAL,
-        holder=session.get('userid'),
+        holder=principal.userid,
         type=type
     )
     volid = get_primary_key()
@@ -386,6 +397,7 @@ def create_special_volunteer_ex(
     return volid
 
 
+@invalidates(THOUGHT)
 def signup_volunteer(volid: int) -> None:
     if not _can_signup(volid):
         raise ZvmsError(ErrorCode.CANT_SIGNUP_FOR_VOLUNTEER)
@@ -395,7 +407,7 @@ def signup_volunteer(volid: int) -> None:
     execute_sql(
         'INSERT INTO user_vol(userid, volid, status, thought, reward) '
         'VALUES(:userid, :volid, :status, "", 0)',
-        userid=session.get('userid'),
+        userid=principal.userid,
         volid=volid,
         status=status
     )
@@ -411,8 +423,9 @@ def _test_signup(userid: int, volid: int) -> None:
             raise ZvmsError(ErrorCode.SIGNUP_NOT_EXISTS)
 
 
+@invalidates(THOUGHT)
 def rollback_volunteer_signup(volid: int, userid: int) -> None:
-    if userid != int(session.get('userid')) and not Permission.CLASS.authorized():
+    if userid != principal.userid and not Permission.CLASS.authorized():
         raise ZvmsError(ErrorCode.CANT_ROLLBACK_OTHERS_SIGNUP)
     _test_signup(userid, volid)
     execute_sql(
@@ -427,6 +440,7 @@ def rollback_volunteer_signup(volid: int, userid: int) -> None:
     )
 
 
+@invalidates(THOUGHT)
 def accept_volunteer_signup(volid: int, userid: int) -> None:
     _test_signup(userid, volid)
     execute_sql(
@@ -446,6 +460,7 @@ def accept_volunteer_signup(volid: int, userid: int) -> None:
     )
 
 
+@invalidates(VOLUNTEER, THOUGHT)
 def delete_volunteer(volid: int) -> None:
     match execute_sql(
         'SELECT holder, name FROM volunteer WHERE id = :volid',
@@ -454,7 +469,7 @@ def delete_volunteer(volid: int) -> None:
         case None:
             abort(404)
         case [holder, name]: ...
-    if holder != int(session.get('userid')):
+    if holder != principal.userid:
         if not Permission.MANAGER.authorized():
             raise ZvmsError(ErrorCode.CANT_DELETE_OTHERS_VOLUNTEER)
         send_notice_to(
@@ -499,7 +514,7 @@ def prepare_modify_volunteer(volid: int) -> tuple[
         case [holder, name, description, reward, time, status, type]:
             if status == VolStatus.REJECTED:
                 raise ZvmsError(ErrorCode.CANT_MODIFY_REJECTED_VOLUNTEER)
-            if holder != int(session.get('userid')) and not Permission.MANAGER.authorized():
+            if holder != principal.userid and not Permission.MANAGER.authorized():
                 raise ZvmsError(ErrorCode.CANT_DELETE_OTHERS_VOLUNTEER)
     participants = execute_sql(
         'SELECT userid, reward '
@@ -533,7 +548,7 @@ def _test_vol(volid: int, expected_kind: VolKind) -> None:
     ).fetchone():
         case None:
             abort(404)
-        case [_, holder] if holder != int(session.get('userid')) and not Permission.MANAGER.authorized():
+        case [_, holder] if holder != principal.userid and not Permission.MANAGER.authorized():
             raise ZvmsError(ErrorCode.CANT_MODIFY_OTHERS_VOLUNTEER)
         case [status, _]:
             if status == VolStatus.REJECTED:
@@ -544,6 +559,7 @@ def _test_vol(volid: int, expected_kind: VolKind) -> None:
             return status
 
 
+@invalidates(VOLUNTEER, THOUGHT)
 def modify_special_volunteer(
     volid: int,
     name: str,
@@ -577,6 +593,7 @@ def modify_special_volunteer(
         )
 
 
+@invalidates(VOLUNTEER, THOUGHT)
 def modify_special_volunteer_ex(
     volid: int,
     name: str,
@@ -609,6 +626,7 @@ def modify_special_volunteer_ex(
         )
 
 
+@invalidates(VOLUNTEER)
 def modify_volunteer(
     volid: int,
     name: str,
@@ -637,6 +655,7 @@ def modify_volunteer(
     _volunteer_helper_post(volid, classes)
 
 
+@invalidates(VOLUNTEER, THOUGHT)
 def modify_appointed_volunteer(
     volid: int,
     name: str,
@@ -1,8 +1,11 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
 from enum import IntEnum, IntFlag
 import logging
 
 from flask_sqlalchemy import SQLAlchemy
-from flask import session
+from flask import session, g, has_request_context
+from werkzeug.local import LocalProxy
 
 logger = logging.getLogger()
 logging.basicConfig(
@@ -36,12 +39,78 @@ class Permission(IntFlag):
 
     def authorized(self, /, that=_empty, *, admin: bool = True) -> bool:
         if that is _empty:
-            that = int(session.get('permission'))
+            that = current_principal().permission
         if that is None:
             return False
         return bool(((self | Permission.ADMIN) if admin else self) & that)
 
 
+class Principal:
+    __slots__ = ('userid', 'username', 'classid', 'permission')
+
+    def __init__(
+        self,
+        userid: int | None,
+        username: str | None,
+        classid: int | None,
+        permission: Permission
+    ) -> None:
+        self.userid = userid
+        self.username = username
+        self.classid = classid
+        self.permission = permission
+
+    def __repr__(self) -> str:
+        return f'Principal({self.userid!r}, {self.username!r}, {self.classid!r}, {self.permission!r})'
+
+    @property
+    def authenticated(self) -> bool:
+        return self.userid is not None
+
+    @classmethod
+    def from_session(cls, session=session) -> 'Principal':
+        if 'userid' not in session:
+            return ANONYMOUS
+        return cls(
+            int(session['userid']),
+            session.get('username'),
+            int(session['classid']),
+            Permission(int(session['permission']))
+        )
+
+    @contextmanager
+    def bind(self):
+        """在Flask请求之外(批处理, 基准测试)以该身份调用kernel"""
+        token = _principal.set(self)
+        try:
+            yield self
+        finally:
+            _principal.reset(token)
+
+
+ANONYMOUS = Principal(None, None, None, Permission(0))
+
+_principal: ContextVar[Principal | None] = ContextVar('principal', default=None)
+
+
+def current_principal() -> Principal:
+    if (principal := _principal.get()) is not None:
+        return principal
+    if not has_request_context():
+        return ANONYMOUS
+    if 'principal' not in g:
+        g.principal = Principal.from_session()
+    return g.principal
+
+
+def forget_principal() -> None:
+    if has_request_context():
+        g.pop('principal', None)
+
+
+principal: Principal = LocalProxy(current_principal)
+
+
 permission2str = {
     Permission.CLASS: '班级',
     Permission.MANAGER: '管理员',
@@ -128,6 +197,8 @@ class ErrorCode(ZvmsEnum):
     FILE_DECODE_FAILS = 23
     THOUGHT_NOT_AUDITABLE = 24
     INVALID_IMAGE_FILE = 25
+    LOGIN_RATE_LIMITED = 26
+    CLASS_NOT_EXISTS = 27
 
     __tostr__ = [
         '无错误',
@@ -154,5 +225,7 @@ class ErrorCode(ZvmsEnum):
         '图片{filename}不存在',
         '文件{filename}解码失败',
         '感想不可审核',
-        '非法图片文件'
+        '非法图片文件',
+        '登录过于频繁, 请稍后再试',
+        '班级{classid}不存在'
     ]
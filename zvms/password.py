@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from base64 import b64encode, b64decode
+import threading
+import hashlib
+import secrets
+import hmac
+
+from flask import Flask, current_app
+
+# 客户端提交的"密码"是原密码的md5; 旧数据库直接存储这个md5,
+# 新格式为 pbkdf2_sha256$迭代次数$盐$哈希
+ALGORITHM = 'pbkdf2_sha256'
+
+_verified: OrderedDict[bytes, None] = OrderedDict()
+_verified_lock = threading.Lock()
+
+
+def init_password(app: Flask) -> None:
+    # pbkdf2_hmac在计算时释放GIL; 专用的线程池限制同时计算的数量.
+    # 等待结果的是run.py中处理WSGI请求的线程, 不是IOLoop
+    app.extensions['password_hash'] = ThreadPoolExecutor(
+        app.config['PASSWORD_HASH_WORKERS'],
+        thread_name_prefix='password'
+    )
+
+
+def _pbkdf2(password: str, salt: bytes, iterations: int) -> bytes:
+    return current_app.extensions['password_hash'].submit(
+        hashlib.pbkdf2_hmac,
+        'sha256',
+        password.encode(),
+        salt,
+        iterations
+    ).result()
+
+
+def hash_password(password: str) -> str:
+    salt = secrets.token_bytes(16)
+    iterations = current_app.config['PASSWORD_HASH_ITERATIONS']
+    digest = _pbkdf2(password, salt, iterations)
+    return f'{ALGORITHM}${iterations}${b64encode(salt).decode()}${b64encode(digest).decode()}'
+
+
+def is_legacy(stored: str) -> bool:
+    return not stored.startswith(ALGORITHM + '$')
+
+
+def needs_rehash(stored: str) -> bool:
+    if is_legacy(stored):
+        return True
+    _, iterations, _, _ = stored.split('$')
+    return int(iterations) != current_app.config['PASSWORD_HASH_ITERATIONS']
+
+
+def _cache_key(password: str, stored: str) -> bytes:
+    return hashlib.sha256(f'{stored}\0{password}'.encode()).digest()
+
+
+def verify_password(password: str, stored: str | None) -> bool:
+    if not stored:
+        return False
+    if is_legacy(stored):
+        return hmac.compare_digest(password.encode(), stored.encode())
+    key = _cache_key(password, stored)
+    with _verified_lock:
+        if key in _verified:
+            _verified.move_to_end(key)
+            return True
+    _, iterations, salt, digest = stored.split('$')
+    if not hmac.compare_digest(
+        _pbkdf2(password, b64decode(salt), int(iterations)),
+        b64decode(digest)
+    ):
+        return False
+    with _verified_lock:
+        _verified[key] = None
+        while len(_verified) > current_app.config['PASSWORD_VERIFY_CACHE_SIZE']:
+            _verified.popitem(last=False)
+    return True
@@ -0,0 +1,252 @@
+from typing import BinaryIO
+import tempfile
+import hashlib
+import time
+import re
+import os
+
+from .framework import ZvmsError
+from .misc import db, ErrorCode, logger
+from .util import execute_sql
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    logger.warning(
+        '`Pillow` not found. Thumbnails will not be generated.')
+    Image = None
+
+PICTURES_DIR = os.path.join(os.path.dirname(__file__), 'static', 'pictures')
+DERIVED_DIR = os.path.join(PICTURES_DIR, 'derived')
+
+# 衍生图片的最大边长
+SIZES = {
+    'thumb': 320,
+    'web': 1280
+}
+
+CHUNK_SIZE = 64 * 1024
+
+# 旧数据中的扩展名保留了上传时的写法, 如.JPG
+FILENAME = re.compile(r'[0-9a-f]{32}\.[0-9a-z]{1,5}', re.IGNORECASE)
+
+# 超过这个时间的临时文件视为上传失败的残留
+STALE_SECONDS = 60 * 60
+
+MAGIC_NUMBERS = [
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp')
+]
+
+
+def sniff_image(head: bytes) -> str | None:
+    for magic, ext in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return ext
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    if head[4:8] == b'ftyp' and head[8:12] in (b'heic', b'heix', b'mif1', b'msf1'):
+        return 'heic'
+    return None
+
+
+# 图片按文件名(md5)的前两位分散到256个子目录中
+def shard_of(filename: str) -> str:
+    return os.path.join(PICTURES_DIR, filename[:2])
+
+
+def path_of(filename: str) -> str:
+    return os.path.join(shard_of(filename), filename)
+
+
+def stage_picture(stream: BinaryIO) -> tuple[str, str]:
+    """
+    把上传的图片分块复制到临时文件, 同时计算md5并检查文件头
+    返回(文件名, 临时文件路径)
+    """
+    os.makedirs(PICTURES_DIR, exist_ok=True)
+    fd, temp = tempfile.mkstemp(suffix='.part', dir=PICTURES_DIR)
+    md5 = hashlib.md5()
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            chunk = stream.read(CHUNK_SIZE)
+            if (ext := sniff_image(chunk)) is None:
+                raise ZvmsError(ErrorCode.INVALID_IMAGE_FILE)
+            while chunk:
+                md5.update(chunk)
+                f.write(chunk)
+                chunk = stream.read(CHUNK_SIZE)
+    except BaseException:
+        os.remove(temp)
+        raise
+    return f'{md5.hexdigest()}.{ext}', temp
+
+
+def commit_picture(filename: str, temp: str) -> None:
+    """
+    原子地把临时文件移动到最终位置
+    必须在插入picture之后调用: 内容相同, 覆盖已有的文件也无妨,
+    而插入时持有的写锁保证了collect_garbage不会在之后删掉它
+    """
+    os.makedirs(shard_of(filename), exist_ok=True)
+    os.replace(temp, path_of(filename))
+
+
+def discard_picture(temp: str) -> None:
+    try:
+        os.remove(temp)
+    except FileNotFoundError:
+        ...
+
+
+def derived_path(filename: str, size: str) -> str:
+    digest, _ = filename.split('.')
+    return os.path.join(DERIVED_DIR, digest[:2], f'{digest}-{size}.jpg')
+
+
+def derive_picture(filename: str, size: str) -> str:
+    """
+    返回缩放后图片的路径, 不存在时生成
+    原图不需要缩放, 无法解码或者没有Pillow时返回原图的路径
+    """
+    if os.path.exists(target := derived_path(filename, size)):
+        return target
+    original = path_of(filename)
+    if Image is None:
+        return original
+    bound = SIZES[size]
+    try:
+        with Image.open(original) as image:
+            if image.width <= bound and image.height <= bound and image.format == 'JPEG':
+                return original
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((bound, bound))
+            if image.mode != 'RGB':
+                background = Image.new('RGB', image.size, 'white')
+                image = image.convert('RGBA')
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            fd, temp = tempfile.mkstemp(
+                suffix='.part', dir=os.path.dirname(target))
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    image.save(f, 'JPEG', quality=80,
+                               optimize=True, progressive=True)
+                os.replace(temp, target)
+            except BaseException:
+                discard_picture(temp)
+                raise
+    except (OSError, Image.DecompressionBombError) as exn:
+        logger.warning(f'Cannot derive {size} picture from {filename}: {exn}')
+        return original
+    return target
+
+
+def _rename(source: str, target: str) -> None:
+    try:
+        os.replace(source, target)
+    except FileNotFoundError:
+        ...
+
+
+def collect_garbage(batch: int = 1000) -> int:
+    """删除引用计数为0的图片, 返回删除的数量"""
+    removed = 0
+    while candidates := execute_sql(
+        'SELECT filename FROM blob WHERE refcount <= 0 LIMIT :batch',
+        batch=batch
+    ).scalars().all():
+        doomed = []
+        try:
+            for filename in candidates:
+                # 先删除记录以取得写锁, 在提交前把文件改名为临时文件:
+                # 提交之后新上传的同名图片不会被删掉, 提交失败时可以改回来
+                if execute_sql(
+                    'DELETE FROM blob WHERE filename = :filename AND refcount <= 0',
+                    filename=filename
+                ).rowcount:
+                    doomed.append(filename)
+                    _rename(path_of(filename), path_of(filename) + '.part')
+            db.session.commit()
+        except BaseException:
+            db.session.rollback()
+            for filename in doomed:
+                _rename(path_of(filename) + '.part', path_of(filename))
+            raise
+        for filename in doomed:
+            discard_picture(path_of(filename) + '.part')
+            for size in SIZES:
+                discard_picture(derived_path(filename, size))
+        removed += len(doomed)
+    return removed
+
+
+def verify_pictures(fix: bool) -> dict[str, list[str]]:
+    """
+    核对磁盘与picture表:
+    missing: 被引用但磁盘上不存在;
+    orphaned: 磁盘上存在但没有记录, 修复时登记为引用计数0, 交给collect_garbage;
+    miscounted: blob表中的引用计数与picture表不一致, 修复时重建;
+    legacy: 未分片存放的旧图片, 修复时移入子目录;
+    stale: 残留的临时文件, 修复时删除
+    """
+    report = {
+        'missing': [],
+        'orphaned': [],
+        'miscounted': [],
+        'legacy': [],
+        'stale': []
+    }
+    referenced = dict(execute_sql(
+        'SELECT filename, COUNT(*) FROM picture GROUP BY filename'
+    ).fetchall())
+    counted = dict(execute_sql('SELECT filename, refcount FROM blob').fetchall())
+    report['miscounted'] = [
+        filename for filename in referenced.keys() | counted.keys()
+        if referenced.get(filename, 0) != max(counted.get(filename, 0), 0)
+    ]
+    on_disk = set()
+    now = time.time()
+    for entry in os.scandir(PICTURES_DIR) if os.path.isdir(PICTURES_DIR) else ():
+        if entry.is_dir() and entry.name != 'derived':
+            entries = os.scandir(entry.path)
+        else:
+            entries = [entry]
+        for file in entries:
+            if not file.is_file():
+                continue
+            if file.name.endswith('.part'):
+                if now - file.stat().st_mtime > STALE_SECONDS:
+                    report['stale'].append(file.path)
+            elif not FILENAME.fullmatch(file.name):
+                continue
+            elif file.path != path_of(file.name):
+                report['legacy'].append(file.name)
+                on_disk.add(file.name)
+            else:
+                on_disk.add(file.name)
+    report['missing'] = sorted(referenced.keys() - on_disk)
+    report['orphaned'] = sorted(on_disk - referenced.keys() - counted.keys())
+    if fix:
+        for filename in report['legacy']:
+            os.makedirs(shard_of(filename), exist_ok=True)
+            os.replace(os.path.join(PICTURES_DIR, filename), path_of(filename))
+        for path in report['stale']:
+            discard_picture(path)
+        if report['miscounted'] or report['orphaned']:
+            execute_sql('DELETE FROM blob')
+            execute_sql(
+                'INSERT INTO blob(filename, refcount) '
+                'SELECT filename, COUNT(*) FROM picture GROUP BY filename'
+            )
+            for filename in on_disk - referenced.keys():
+                execute_sql(
+                    'INSERT INTO blob(filename, refcount) VALUES(:filename, 0)',
+                    filename=filename
+                )
+        db.session.commit()
+    return report
@@ -0,0 +1,65 @@
+from typing import Callable
+import threading
+import json
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .misc import db, logger
+
+Listener = Callable[[str, str], None]
+
+
+class Broker:
+    """
+    进程内的发布/订阅, 用于向SSE连接推送通知和工具箱状态.
+    主题: school, user:<userid>, class:<classid>, toolkit
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.topics: dict[str, set[Listener]] = {}
+
+    def subscribe(self, topics: list[str], listener: Listener) -> Callable[[], None]:
+        """listener(event, data)可能在任意线程中被调用, 返回取消订阅的函数"""
+        with self.lock:
+            for topic in topics:
+                self.topics.setdefault(topic, set()).add(listener)
+
+        def unsubscribe() -> None:
+            with self.lock:
+                for topic in topics:
+                    listeners = self.topics.get(topic, set())
+                    listeners.discard(listener)
+                    if not listeners:
+                        self.topics.pop(topic, None)
+        return unsubscribe
+
+    def publish(self, topic: str, event: str, data) -> None:
+        with self.lock:
+            listeners = list(self.topics.get(topic, ()))
+        payload = json.dumps(data)
+        for listener in listeners:
+            try:
+                listener(event, payload)
+            except Exception as exn:
+                logger.exception(exn)
+
+
+broker = Broker()
+
+
+def publish_after_commit(topic: str, event: str, data) -> None:
+    """在当前事务提交后发布, 回滚时丢弃"""
+    db.session.info.setdefault('publish', []).append((topic, event, data))
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_after_commit(session: Session) -> None:
+    for message in session.info.pop('publish', ()):
+        broker.publish(*message)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_after_rollback(session: Session, previous_transaction) -> None:
+    session.info.pop('publish', None)
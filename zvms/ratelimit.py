@@ -0,0 +1,157 @@
+from abc import ABCMeta, abstractmethod
+import threading
+import sqlite3
+import time
+import os
+
+from flask import Flask, current_app, request
+
+from .framework import ZvmsError
+from .misc import ErrorCode, logger
+
+
+class TokenBucket(metaclass=ABCMeta):
+    def __init__(self, /, capacity: float, rate: float) -> None:
+        self.capacity = capacity
+        self.rate = rate
+
+    def refill(self, /, tokens: float, updated: float, now: float) -> float:
+        return min(self.capacity, tokens + (now - updated) * self.rate)
+
+    @abstractmethod
+    def consume(self, /, key: str) -> bool: ...
+
+    @abstractmethod
+    def prune(self) -> int:
+        """删除已经回满的桶(与不存在的桶等价), 返回删除的数量"""
+
+
+class MemoryTokenBucket(TokenBucket):
+    def __init__(self, /, capacity: float, rate: float, max_keys: int = 65536) -> None:
+        super().__init__(capacity, rate)
+        self.max_keys = max_keys
+        self.buckets: dict[str, tuple[float, float]] = {}
+        self.lock = threading.Lock()
+
+    def consume(self, /, key: str) -> bool:
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (self.capacity, now))
+            tokens = self.refill(tokens, updated, now)
+            if allowed := tokens >= 1:
+                tokens -= 1
+            self.buckets[key] = tokens, now
+            if len(self.buckets) > self.max_keys:
+                self._prune(now)
+        return allowed
+
+    def _prune(self, /, now: float) -> int:
+        count = len(self.buckets)
+        self.buckets = {
+            k: (t, u) for k, (t, u) in self.buckets.items()
+            if self.refill(t, u, now) < self.capacity
+        }
+        return count - len(self.buckets)
+
+    def prune(self) -> int:
+        with self.lock:
+            return self._prune(time.monotonic())
+
+
+class SqliteTokenBucket(TokenBucket):
+    def __init__(self, /, capacity: float, rate: float, path: str, table: str) -> None:
+        super().__init__(capacity, rate)
+        self.path = path
+        self.table = table
+        self.local = threading.local()
+        with self.connection() as connection:
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute(
+                f'CREATE TABLE IF NOT EXISTS {table}('
+                'key VARCHAR(64) PRIMARY KEY, '
+                'tokens REAL, '
+                'updated REAL'
+                ')'
+            )
+
+    def connection(self) -> sqlite3.Connection:
+        if (connection := getattr(self.local, 'connection', None)) is None:
+            connection = self.local.connection = sqlite3.connect(
+                self.path,
+                timeout=5,
+                isolation_level=None
+            )
+        return connection
+
+    def consume(self, /, key: str) -> bool:
+        connection = self.connection()
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            match connection.execute(
+                f'SELECT tokens, updated FROM {self.table} WHERE key = ?',
+                (key,)
+            ).fetchone():
+                case None:
+                    tokens = self.capacity
+                case [tokens, updated]:
+                    tokens = self.refill(tokens, updated, now)
+            if allowed := tokens >= 1:
+                tokens -= 1
+            connection.execute(
+                f'INSERT OR REPLACE INTO {self.table}(key, tokens, updated) '
+                'VALUES(?, ?, ?)',
+                (key, tokens, now)
+            )
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return allowed
+
+    def prune(self) -> int:
+        # 不存在的用户名也会成为键, 不清理的话表会无限增长
+        return self.connection().execute(
+            f'DELETE FROM {self.table} WHERE tokens + (? - updated) * ? >= ?',
+            (time.time(), self.rate, self.capacity)
+        ).rowcount
+
+
+def init_rate_limit(app: Flask) -> None:
+    (ip_capacity, ip_rate) = app.config['LOGIN_RATE_LIMIT_IP']
+    (user_capacity, user_rate) = app.config['LOGIN_RATE_LIMIT_USER']
+    match app.config['LOGIN_RATE_LIMIT_STORE']:
+        case 'memory':
+            buckets = (
+                MemoryTokenBucket(ip_capacity, ip_rate),
+                MemoryTokenBucket(user_capacity, user_rate)
+            )
+        case 'sqlite':
+            os.makedirs(app.instance_path, exist_ok=True)
+            path = os.path.join(
+                app.instance_path, app.config['LOGIN_RATE_LIMIT_PATH'])
+            buckets = (
+                SqliteTokenBucket(ip_capacity, ip_rate, path, 'ip_bucket'),
+                SqliteTokenBucket(user_capacity, user_rate, path, 'user_bucket')
+            )
+        case kind:
+            raise ValueError(f'Unknown rate limit store: {kind}')
+    app.extensions['login_rate_limit'] = buckets
+
+
+def prune_rate_limit() -> None:
+    if (count := sum(
+        bucket.prune() for bucket in current_app.extensions['login_rate_limit']
+    )):
+        logger.info(f'{count} idle rate limit buckets pruned')
+
+
+def check_login_rate(userident: str) -> None:
+    ip_bucket, user_bucket = current_app.extensions['login_rate_limit']
+    ip = request.remote_addr or ''
+    # 账号的桶按(账号, IP)区分: 否则任何人每分钟尝试一次就能让这个账号一直无法登录
+    if not (
+        ip_bucket.consume(ip) and
+        user_bucket.consume(f'{userident}@{ip}')
+    ):
+        raise ZvmsError(ErrorCode.LOGIN_RATE_LIMITED)
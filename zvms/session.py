@@ -0,0 +1,259 @@
+from collections import OrderedDict
+from abc import ABCMeta, abstractmethod
+from datetime import datetime, timezone
+import threading
+import secrets
+import sqlite3
+import time
+import os
+
+from flask import Flask, Request, Response, current_app
+from flask.sessions import SessionInterface, SessionMixin
+from flask.json.tag import TaggedJSONSerializer
+from werkzeug.datastructures import CallbackDict
+
+from .misc import logger
+
+
+def generate_sid() -> str:
+    return secrets.token_urlsafe(18)
+
+
+class SessionStore(metaclass=ABCMeta):
+    def __init__(self, /, sweep_interval: float) -> None:
+        self.sweep_interval = sweep_interval
+        self.last_sweep = time.monotonic()
+
+    @abstractmethod
+    def load(self, /, sid: str) -> str | None: ...
+
+    @abstractmethod
+    def save(self, /, sid: str, userid: int | None, data: str, expire: float) -> None: ...
+
+    @abstractmethod
+    def delete(self, /, sid: str) -> None: ...
+
+    @abstractmethod
+    def revoke(self, /, userid: int) -> None: ...
+
+    @abstractmethod
+    def sweep(self, /, now: float) -> int: ...
+
+    def maybe_sweep(self) -> None:
+        if time.monotonic() - self.last_sweep < self.sweep_interval:
+            return
+        self.last_sweep = time.monotonic()
+        if (count := self.sweep(time.time())):
+            logger.info(f'{count} expired sessions swept')
+
+
+class MemorySessionStore(SessionStore):
+    """单进程用, 按最近使用淘汰"""
+
+    def __init__(self, /, capacity: int, sweep_interval: float) -> None:
+        super().__init__(sweep_interval)
+        self.capacity = capacity
+        self.sessions: OrderedDict[str, tuple[int | None, str, float]] = OrderedDict()
+        self.users: dict[int, set[str]] = {}
+        self.lock = threading.Lock()
+
+    def load(self, /, sid: str) -> str | None:
+        with self.lock:
+            match self.sessions.get(sid):
+                case None:
+                    return None
+                case [_, _, expire] if expire < time.time():
+                    self._delete(sid)
+                    return None
+                case [_, data, _]:
+                    self.sessions.move_to_end(sid)
+                    return data
+
+    def save(self, /, sid: str, userid: int | None, data: str, expire: float) -> None:
+        with self.lock:
+            self._delete(sid)
+            self.sessions[sid] = userid, data, expire
+            if userid is not None:
+                self.users.setdefault(userid, set()).add(sid)
+            while len(self.sessions) > self.capacity:
+                self._delete(next(iter(self.sessions)))
+
+    def _delete(self, /, sid: str) -> None:
+        match self.sessions.pop(sid, None):
+            case [int(userid), _, _]:
+                sids = self.users[userid]
+                sids.discard(sid)
+                if not sids:
+                    del self.users[userid]
+
+    def delete(self, /, sid: str) -> None:
+        with self.lock:
+            self._delete(sid)
+
+    def revoke(self, /, userid: int) -> None:
+        with self.lock:
+            for sid in list(self.users.get(userid, ())):
+                self._delete(sid)
+
+    def sweep(self, /, now: float) -> int:
+        with self.lock:
+            expired = [
+                sid for sid, (_, _, expire) in self.sessions.items()
+                if expire < now
+            ]
+            for sid in expired:
+                self._delete(sid)
+        return len(expired)
+
+
+class SqliteSessionStore(SessionStore):
+    """多个worker进程共享同一个数据库文件"""
+
+    def __init__(self, /, path: str, sweep_interval: float) -> None:
+        super().__init__(sweep_interval)
+        self.path = path
+        self.local = threading.local()
+        with self.connection() as connection:
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS session('
+                'sid CHAR(24) PRIMARY KEY, '
+                'userid INT, '
+                'data TEXT, '
+                'expire REAL'
+                ')'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS session_userid ON session(userid)'
+            )
+
+    def connection(self) -> sqlite3.Connection:
+        if (connection := getattr(self.local, 'connection', None)) is None:
+            connection = self.local.connection = sqlite3.connect(
+                self.path,
+                timeout=5
+            )
+            connection.execute('PRAGMA synchronous = NORMAL')
+        return connection
+
+    def load(self, /, sid: str) -> str | None:
+        match self.connection().execute(
+            'SELECT data FROM session WHERE sid = ? AND expire >= ?',
+            (sid, time.time())
+        ).fetchone():
+            case None:
+                return None
+            case [data]:
+                return data
+
+    def save(self, /, sid: str, userid: int | None, data: str, expire: float) -> None:
+        with self.connection() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO session(sid, userid, data, expire) '
+                'VALUES(?, ?, ?, ?)',
+                (sid, userid, data, expire)
+            )
+
+    def delete(self, /, sid: str) -> None:
+        with self.connection() as connection:
+            connection.execute('DELETE FROM session WHERE sid = ?', (sid,))
+
+    def revoke(self, /, userid: int) -> None:
+        with self.connection() as connection:
+            connection.execute(
+                'DELETE FROM session WHERE userid = ?', (userid,))
+
+    def sweep(self, /, now: float) -> int:
+        with self.connection() as connection:
+            return connection.execute(
+                'DELETE FROM session WHERE expire < ?', (now,)
+            ).rowcount
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, /, initial: dict | None = None, sid: str | None = None) -> None:
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = sid is None
+        self.userid = self.get('userid')
+        self.modified = False
+
+
+class ServerSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, /, store: SessionStore) -> None:
+        self.store = store
+
+    def open_session(self, app: Flask, request: Request) -> ServerSession:
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and (data := self.store.load(sid)) is not None:
+            try:
+                return ServerSession(self.serializer.loads(data), sid)
+            except ValueError:
+                ...
+        return ServerSession()
+
+    def save_session(self, app: Flask, session: ServerSession, response: Response) -> None:
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        self.store.maybe_sweep()
+        if not session:
+            if session.sid is not None:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if not session.modified:
+            return
+        userid = session.get('userid')
+        if session.sid is None or userid != session.userid:
+            # 登录或切换账号时更换会话ID
+            if session.sid is not None:
+                self.store.delete(session.sid)
+            session.sid = generate_sid()
+        expires = datetime.now(timezone.utc) + app.permanent_session_lifetime
+        self.store.save(
+            session.sid,
+            userid,
+            self.serializer.dumps(dict(session)),
+            expires.timestamp()
+        )
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+
+def init_session(app: Flask) -> None:
+    match app.config['SESSION_STORE']:
+        case 'cookie':
+            return
+        case 'memory':
+            store = MemorySessionStore(
+                app.config['SESSION_STORE_CAPACITY'],
+                app.config['SESSION_SWEEP_INTERVAL']
+            )
+        case 'sqlite':
+            os.makedirs(app.instance_path, exist_ok=True)
+            store = SqliteSessionStore(
+                os.path.join(app.instance_path, app.config['SESSION_STORE_PATH']),
+                app.config['SESSION_SWEEP_INTERVAL']
+            )
+        case kind:
+            raise ValueError(f'Unknown session store: {kind}')
+    app.session_interface = ServerSessionInterface(store)
+
+
+def revoke_sessions(userid: int) -> None:
+    """使该用户的所有会话立即失效; 使用cookie会话时无法做到"""
+    if isinstance(interface := current_app.session_interface, ServerSessionInterface):
+        interface.store.revoke(userid)
@@ -6,6 +6,7 @@ import csv
 
 from flask import (
     Blueprint,
+    Response,
     redirect,
     request,
     abort
@@ -24,6 +25,9 @@ from ..util import (
     render_template
 )
 from ..misc import Permission, logger
+from .settings import SettingsStore
+from ..pubsub import broker
+from .. import config
 
 Toolkit = Blueprint('Toolkit', __name__, url_prefix='/toolkit')
 
@@ -46,34 +50,26 @@ try:
                 `translation` TEXT
                 )
                 '''
-        connection = sqlite3.connect(':memory:')
-        cursor = connection.cursor()
-        cursor.execute(sql)
+        # 加载后只读, 可以在多个请求线程中共用
+        connection = sqlite3.connect(':memory:', check_same_thread=False)
+        connection.execute(sql)
         reader = iter(csv.reader(f))
         next(reader)
         for word, phonetic, definition, translation, *_ in reader:
-            cursor.execute(
+            connection.execute(
                 'INSERT INTO stardict(`word`, `phonetic`, `definition`, `translation`) VALUES(?, ?, ?, ?)',
                 (word, phonetic, definition, translation)
             )
 except OSError:
     logger.warning(
         '`ecdict.csv` not found. Online dictionary service will not be provided.')
-    cursor = None
+    connection = None
 
-try:
-    with open(os.path.join(directory, 'toolkit-settings.json'), encoding='utf-8') as f:
-        settings = json.load(f)
-except OSError:
-    logger.info(
-        '`toolkit-settings.json` not found. Default settings have been applied.')
-    settings = {
-        'libraryUrl': '',
-        'music': None,
-        'opening': {
-            'kind': 'close'
-        }
-    }
+settings = SettingsStore(
+    os.path.join(directory, 'toolkit-settings.json'),
+    config.TOOLKIT_SETTINGS_WATCH_INTERVAL
+)
+settings.subscribe(lambda: broker.publish('toolkit', 'opening', settings.data['opening']))
 
 
 @toolkit_route(Toolkit, url(''), 'GET')
@@ -106,7 +102,7 @@ def dict_get(
     kind: str = _no_word,
     word: lengthedstr[45] = _no_word
 ):
-    if cursor is None:
+    if connection is None:
         raise ZvmsError('电子词典不可用')
     if word is _no_word:
         return render_template('toolkit/dict_query.html')
@@ -122,8 +118,7 @@ def dict_get(
             clause = 'word LIKE ?'
             word = f'%{word}%'
     sql = 'SELECT word, phonetic, definition, translation FROM stardict WHERE ' + clause
-    cursor.execute(sql, (word,))
-    match cursor.fetchall():
+    match connection.execute(sql, (word,)).fetchall():
         case None:
             raise ZvmsError('查无此结果')
         case [[word, phonetic, definition, translation]]:
@@ -163,8 +158,8 @@ def weather():
 def literacy():
     return render_template(
         'toolkit/literacy.html',
-        library_url=settings['libraryUrl'],
-        music=settings['music']
+        library_url=settings.get('libraryUrl'),
+        music=settings.get('music')
     )
 
 
@@ -174,22 +169,17 @@ def literacy():
 def management_get():
     return render_template(
         'toolkit/management.html',
-        library_url=settings['libraryUrl']
+        library_url=settings.get('libraryUrl')
     )
 
 
-def save_settings():
-    with open(os.path.join(directory, 'toolkit-settings.json'), 'w', encoding='utf-8') as f:
-        json.dump(settings, f)
-
-
 @toolkit_route(Toolkit, url.management, 'POST')
 @login_required
 @permission(Permission.ADMIN)
 def management_post():
     match request.form:
         case {'action': 'set-library-url', 'url': url}:
-            settings['libraryUrl'] = url
+            settings.update(libraryUrl=url)
         case {'action': 'search-music', 'keyword': keyword}:
             data = json.loads(
                 get_with_timeout(
@@ -200,18 +190,17 @@ def management_post():
                 datum['url'] = json.loads(get_with_timeout('https://music-api.tonzhon.com/song_file/' + datum['newId']).text)['data']
             return render_template('toolkit/music_search.html', data=data)
         case {'action': 'close-music'}:
-            settings['music'] = None
+            settings.update(music=None)
         case {'action': 'set-opening', 'kind': 'timeLimit', 'start': start, 'end': end}:
-            settings['opening'] = {
+            settings.update(opening={
                 'kind': 'timeLimit',
                 'start': start,
                 'end': end
-            }
+            })
         case {'action': 'set-opening', 'kind': kind}:
-            settings['opening']['kind'] = kind
+            settings.update(opening=settings.get('opening') | {'kind': kind})
         case _:
             return render_template('toolkit/error.html', msg='无效的管理动作: ' + json.dumps(request.form))
-    save_settings()
     return redirect('/toolkit/management')
 
 
@@ -219,14 +208,18 @@ def management_post():
 @login_required
 @permission(Permission.ADMIN)
 def music_search(title: str, url: str):
-    settings['music'] = {
+    settings.update(music={
         'title': title,
         'url': url
-    }
-    save_settings()
+    })
     return redirect('/toolkit/management')
 
 
+# 在tornado下由handlers.HeartbeatHandler处理, 并支持长轮询
 @Toolkit.route('/heartbeat')
 def heartbeat():
-    return json.dumps(settings['opening'])
+    body, etag = settings.heartbeat()
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
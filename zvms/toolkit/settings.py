@@ -0,0 +1,139 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Any
+import threading
+import tempfile
+import hashlib
+import json
+import time
+import os
+
+from ..misc import logger
+
+DEFAULT_SETTINGS = {
+    'libraryUrl': '',
+    'music': None,
+    'opening': {
+        'kind': 'close'
+    }
+}
+
+
+class SettingsStore:
+    """
+    工具箱设置, 保存在json文件中, 多个进程通过文件的修改时间得知其他进程的修改.
+    修改只替换内存中的设置, 由一个后台线程按顺序写文件, 不阻塞请求;
+    本进程还有没写完的修改时不重新读取文件, 以免读到较早的版本.
+    心跳的响应体和ETag在设置改变时预先生成
+    """
+
+    def __init__(self, path: str, watch_interval: float) -> None:
+        self.path = path
+        self.watch_interval = watch_interval
+        self.lock = threading.Lock()
+        self.writer = ThreadPoolExecutor(1, thread_name_prefix='toolkit-settings')
+        self.listeners: list[Callable[[], None]] = []
+        self.mtime: int | None = None
+        # 本进程修改的次数, 和已经写入文件的修改
+        self.version = 0
+        self.written = 0
+        self.checked = 0.0
+        self.data: dict = DEFAULT_SETTINGS
+        self._heartbeat = self._serialize()
+        try:
+            self._load()
+        except FileNotFoundError:
+            logger.info(
+                '`toolkit-settings.json` not found. Default settings have been applied.')
+
+    def _serialize(self) -> tuple[bytes, str]:
+        body = json.dumps(self.data['opening']).encode()
+        return body, hashlib.md5(body).hexdigest()
+
+    def _load(self) -> None:
+        version = self.version
+        mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path, encoding='utf-8') as f:
+            data = json.load(f)
+        with self.lock:
+            # 读取期间本进程修改了设置, 读到的文件已经过时
+            if version != self.version:
+                return
+            changed = self._replace(data, mtime)
+        if changed:
+            self._notify()
+
+    def _replace(self, data: dict, mtime: int | None) -> bool:
+        """在self.lock中调用, 返回心跳的内容是否改变"""
+        self.data = data
+        self.mtime = mtime
+        previous, self._heartbeat = self._heartbeat, self._serialize()
+        return previous[1] != self._heartbeat[1]
+
+    def _notify(self) -> None:
+        for listener in self.listeners:
+            listener()
+
+    def refresh(self, force: bool = False) -> None:
+        """其他进程修改了文件时重新读取; 未到检查间隔时什么也不做"""
+        now = time.monotonic()
+        if not force and now - self.checked < self.watch_interval:
+            return
+        self.checked = now
+        if self.written != self.version:
+            return
+        try:
+            if os.stat(self.path).st_mtime_ns != self.mtime:
+                self._load()
+        except FileNotFoundError:
+            ...
+        except (OSError, ValueError) as exn:
+            # 可能读到了正在被其他进程写入的文件, 下次再试
+            logger.warning(f'Cannot reload toolkit settings: {exn}')
+
+    def subscribe(self, listener: Callable[[], None]) -> None:
+        """心跳内容改变时调用listener, 可能在任意线程中"""
+        self.listeners.append(listener)
+
+    def get(self, key: str) -> Any:
+        self.refresh()
+        return self.data[key]
+
+    def heartbeat(self) -> tuple[bytes, str]:
+        """(响应体, ETag)"""
+        self.refresh()
+        return self._heartbeat
+
+    def update(self, **changes) -> None:
+        with self.lock:
+            self.version += 1
+            data = self.data | changes
+            changed = self._replace(data, self.mtime)
+            # 在锁内提交, 写入的顺序与版本的顺序相同
+            self.writer.submit(self._write, data, self.version)
+        if changed:
+            self._notify()
+
+    def _write(self, data: dict, version: int) -> None:
+        mtime = None
+        directory, _ = os.path.split(self.path)
+        fd, temp = tempfile.mkstemp(suffix='.part', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(temp, self.path)
+            mtime = os.stat(self.path).st_mtime_ns
+        except BaseException as exn:
+            logger.exception(exn)
+            try:
+                os.remove(temp)
+            except FileNotFoundError:
+                ...
+        with self.lock:
+            self.written = version
+            # 自己写入的修改不需要重新读取
+            if mtime is not None and version == self.version:
+                self.mtime = mtime
+
+    def close(self) -> None:
+        """等待尚未完成的写入"""
+        self.writer.shutdown(wait=True)
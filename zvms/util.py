@@ -4,19 +4,29 @@ from random import choice
 import hashlib
 import re
 
-from flask import session, render_template as _render_template
+from flask import render_template as _render_template
 from mistune import Markdown, HTMLRenderer
 from requests.exceptions import Timeout
-from sqlalchemy.sql import text
+from sqlalchemy.sql import text, bindparam
 from sqlalchemy import Result
 import requests
 
-from .misc import db, Permission, ErrorCode
+from .misc import db, Permission, ErrorCode, principal
 from .framework import ZvmsError
 
 
 def execute_sql(sql: str, **kwargs) -> Result:
-    return db.session.execute(text(sql), kwargs)
+    # list和tuple参数用于`IN :param`
+    return db.session.execute(text(sql).bindparams(*(
+        bindparam(name, expanding=True)
+        for name, value in kwargs.items()
+        if isinstance(value, (list, tuple))
+    )), kwargs)
+
+
+def execute_many(sql: str, rows: list[dict]) -> None:
+    if rows:
+        db.session.execute(text(sql), rows)
 
 
 def md5(s: bytes) -> str:
@@ -30,19 +40,17 @@ def inexact_now() -> datetime:
 
 
 def username2userid(usernames: Iterable[str]) -> list[int]:
+    from .kernel.user import user_index
+    ids, userids = user_index()
     ret = []
     for username in usernames:
-        match execute_sql(
-            'SELECT userid '
-            'FROM user WHERE {} = :username'.format(
-                'userid' if username.isdecimal() else 'username'
-            ),
-            username=username
-        ).fetchone():
-            case None:
-                raise ZvmsError(f'用户{username}不存在')
-            case [id]:
-                ret.append(id)
+        if username.isdecimal():
+            id = int(username) if int(username) in userids else None
+        else:
+            id = ids.get(username)
+        if id is None:
+            raise ZvmsError(f'用户{username}不存在')
+        ret.append(id)
     if len(ret) != len(set(ret)):
         raise ZvmsError(ErrorCode.VALIDATION_FAILS)
     return ret
@@ -57,9 +65,9 @@ def render_template(template_name: str, **context) -> str:
         template_name,
         **context,
         _year=datetime.now().year,
-        _login='userid' in session,
-        _userid=session.get('userid'),
-        _permission=session.get('permission'),
+        _login=principal.authenticated,
+        _userid=principal.userid,
+        _permission=principal.permission,
         Permission=Permission
     )
 
@@ -79,23 +87,17 @@ def three_days_later() -> date:
 
 
 def send_notice_to(title: str, content: str, target: int, class_notice: bool = False) -> None:
+    # 写入发件箱, 与当前事务一同提交, 由dispatch.NoticeDispatcher异步投递
     execute_sql(
-        'INSERT INTO notice(title, content, sender, school, expire) '
-        'VALUES(:title, :content, 0, FALSE, :expire)',
+        'INSERT INTO notice_outbox(title, content, target, class_notice, expire) '
+        'VALUES(:title, :content, :target, :class_notice, :expire)',
         title=title,
         content=content,
-        expire=three_days_later()
-    )
-    noticeid = get_primary_key()
-    execute_sql(
-        'INSERT INTO {}({}, noticeid) '
-        'VALUES(:target, :noticeid)'.format(
-            'class_notice' if class_notice else 'user_notice',
-            'classid' if class_notice else 'userid'
-        ),
         target=target,
-        noticeid=noticeid
+        class_notice=class_notice,
+        expire=three_days_later()
     )
+    db.session.info['notice_outbox'] = True
 
 
 def random_color() -> str:
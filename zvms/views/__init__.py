@@ -3,6 +3,7 @@ from flask import Blueprint
 from .about import About
 from .admin import Admin
 from .management import Management
+from .picture import Picture
 from .thought import Thought
 from .user import User
 from .volunteer import Volunteer
@@ -12,6 +13,7 @@ Views = Blueprint('Views', __name__)
 Views.register_blueprint(About)
 Views.register_blueprint(Admin)
 Views.register_blueprint(Management)
+Views.register_blueprint(Picture)
 Views.register_blueprint(Thought)
 Views.register_blueprint(User)
 Views.register_blueprint(Volunteer)
@@ -9,6 +9,7 @@ from flask import (
 from ..util import (
     render_template,
     three_days_later,
+    pagination
 )
 from ..framework import (
     ZvmsError,
@@ -18,6 +19,7 @@ from ..framework import (
     url
 )
 from ..kernel import notice as NoticeKernel
+from ..kernel import user as UserKernel
 from ..kernel import issue as IssueKernel
 from ..misc import Permission
 
@@ -28,10 +30,13 @@ Management = Blueprint('Management', __name__, url_prefix='/management')
 @login_required
 @permission(Permission.MANAGER)
 def index():
+    classes = [(id, name) for id, name in UserKernel.get_classes() if id]
     return render_template(
         'zvms/management.html',
         issues=IssueKernel.list_issues(),
-        three_days_later=three_days_later().isoformat()
+        three_days_later=three_days_later().isoformat(),
+        classes=classes,
+        grades=sorted({id // 100 for id, _ in classes})
     )
 
 
@@ -44,8 +49,12 @@ def send_notice(
     school: bool,
     anonymous: bool,
     targets: list[str],
+    classes: list[int],
+    grades: list[int],
     expire: date
 ):
+    # 留空的输入框
+    targets = [target for target in targets if target]
     if school:
         NoticeKernel.send_school_notice(
             title,
@@ -54,14 +63,16 @@ def send_notice(
             expire
         )
     else:
-        if not targets:
+        if not (targets or classes or grades):
             raise ZvmsError('应至少提供一个目标')
         NoticeKernel.send_notice(
             title,
             content,
             anonymous,
             targets,
-            expire
+            expire,
+            classes,
+            grades
         )
     return redirect('/management')
 
@@ -69,13 +80,18 @@ def send_notice(
 @zvms_route(Management, url.edit_notices, 'GET')
 @login_required
 @permission(Permission.MANAGER)
-def edit_notices_get():
+def edit_notices_get(page: int = 0):
+    total, notices = NoticeKernel.list_notices(page)
     return render_template(
         'zvms/edit_notices.html',
         notices=[
-            (*spam, list(enumerate(targets)))
-            for *spam, targets in NoticeKernel.list_notices()
-        ]
+            (*spam, list(enumerate(targets)), classes)
+            for *spam, targets, classes in notices
+        ],
+        base_url='/management/edit-notices',
+        page=page,
+        pages=pagination(page, total),
+        total=total
     )
 
 
@@ -0,0 +1,39 @@
+from flask import (
+    Blueprint,
+    send_file,
+    request,
+    abort
+)
+
+from ..pictures import (
+    derive_picture,
+    path_of,
+    FILENAME,
+    SIZES
+)
+
+Picture = Blueprint('Picture', __name__, url_prefix='/picture')
+
+# 文件名即内容的md5, 可以永久缓存
+MAX_AGE = 365 * 24 * 60 * 60
+
+
+@Picture.route('/<filename>')
+def picture(filename: str):
+    if not FILENAME.fullmatch(filename):
+        abort(404)
+    match request.args.get('size'):
+        case None:
+            path = path_of(filename)
+        case size if size in SIZES:
+            # 原图不存在时返回原图的路径, 由send_file返回404
+            path = derive_picture(filename, size)
+        case _:
+            abort(404)
+    try:
+        response = send_file(path, max_age=MAX_AGE, conditional=True)
+    except FileNotFoundError:
+        abort(404)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
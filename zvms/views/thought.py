@@ -1,10 +1,12 @@
+from typing import Callable
+from functools import partial
 import csv
 import io
 
 from werkzeug.datastructures import FileStorage
 from flask import (
     Blueprint,
-    send_file,
+    Response,
     redirect,
 )
 
@@ -23,7 +25,13 @@ from ..framework import (
 from ..misc import (
     ThoughtStatus,
     Permission,
-    VolType
+    VolType,
+    principal
+)
+from ..cache import (
+    fragments,
+    VOLUNTEER,
+    THOUGHT
 )
 from ..kernel import thought as ThoughtKernel
 from ..kernel import user as UserKernel
@@ -31,32 +39,47 @@ from ..kernel.thought import SelectResult
 
 Thought = Blueprint('Thought', __name__, url_prefix='/thought')
 
+CSV_CHUNK_ROWS = 256
+
 
 @zvms_route(Thought, url.csv, 'GET')
 @login_required
 @permission(Permission.MANAGER)
 def data_csv():
-    file = io.StringIO()
-    writer = csv.writer(file)
     users = execute_sql(
         'SELECT user.userid, user.username, class.name '
         'FROM user '
         'JOIN class ON class.id = user.classid '
         'WHERE user.classid != 0'
     ).fetchall()
-    writer.writerow(['学号', '姓名', '班级', '校内', '校外', '实践', '合计'])
-    writer.writerows(
-        (id, name, cls, *(d.get(i, 0) / 60 for i in range(1, 4)), sum(d.values()) / 60)
-        for id, name, cls in users
-        if (d := UserKernel.get_time_sums(id)) or True
+    sums = UserKernel.get_all_time_sums()
+
+    # 分块生成, 不在内存中拼出整个文件; 在run.py下WSGIContainer仍会合并响应体再发送
+    def generate():
+        file = io.StringIO()
+        writer = csv.writer(file)
+        writer.writerow(['学号', '姓名', '班级', '校内', '校外', '实践', '合计'])
+        for count, (id, name, cls) in enumerate(users, 1):
+            d = sums.get(id, {})
+            writer.writerow(
+                (id, name, cls, *(d.get(i, 0) / 60 for i in range(1, 4)), sum(d.values()) / 60))
+            if count % CSV_CHUNK_ROWS == 0:
+                yield file.getvalue().encode()
+                file.seek(0)
+                file.truncate()
+        yield file.getvalue().encode()
+
+    return Response(
+        generate(),
+        mimetype='text/csv',
+        headers={'Content-Disposition': 'inline; filename=data.csv'}
     )
-    return send_file(io.BytesIO(file.getvalue().encode()), download_name='data.csv')
 
 
-def select_thoughts(result: SelectResult, page: int, base_url: str):
-    total, thoughts = result
+def _render_thoughts(select: Callable[[], SelectResult], page: int, base_url: str) -> str:
+    total, thoughts = select()
     return render_template(
-        'zvms/thought/list.html',
+        'zvms/thought/list_items.html',
         data=[
             (*spam, ThoughtStatus(status), ThoughtStatus(status).badge())
             for *spam, status in thoughts
@@ -68,12 +91,23 @@ def select_thoughts(result: SelectResult, page: int, base_url: str):
     )
 
 
+def select_thoughts(select: Callable[[], SelectResult], page: int, base_url: str, *key):
+    return render_template(
+        'zvms/thought/list.html',
+        fragment=fragments.get(
+            (base_url, page, *key),
+            (VOLUNTEER, THOUGHT),
+            partial(_render_thoughts, select, page, base_url)
+        )
+    )
+
+
 @zvms_route(Thought, url.list, 'GET')
 @login_required
 @permission(Permission.MANAGER | Permission.AUDITOR)
 def list_thoughts(page: int = 0):
     return select_thoughts(
-        ThoughtKernel.list_thoughts(page),
+        partial(ThoughtKernel.list_thoughts, page),
         page,
         '/thought/list'
     )
@@ -83,9 +117,10 @@ def list_thoughts(page: int = 0):
 @login_required
 def my_thoughts(page: int = 0):
     return select_thoughts(
-        ThoughtKernel.my_thoughts(page),
+        partial(ThoughtKernel.my_thoughts, page),
         page,
-        '/thought/me'
+        '/thought/me',
+        principal.userid
     )
 
 
@@ -94,9 +129,10 @@ def my_thoughts(page: int = 0):
 @permission(Permission.AUDITOR | Permission.MANAGER)
 def unaudited_thoughts(page: int = 0):
     return select_thoughts(
-        ThoughtKernel.unaudited_thoutghts(page),
+        partial(ThoughtKernel.unaudited_thoutghts, page),
         page,
-        '/thought/unaudited'
+        '/thought/unaudited',
+        Permission.MANAGER.authorized()
     )
 
 
@@ -163,7 +199,7 @@ def edit_thought(
     submit: bool
 ):
     files = [
-        (file.filename, file.read())
+        file.stream
         for file in files
         if file.filename
     ]
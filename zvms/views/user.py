@@ -8,7 +8,6 @@ from flask import (
 from ..util import (
     render_template,
     render_markdown,
-    execute_sql,
     md5
 )
 from ..framework import (
@@ -18,7 +17,7 @@ from ..framework import (
 )
 from ..kernel import notice as NoticeKernel
 from ..kernel import user as UserKernel
-from ..misc import Permission
+from ..misc import Permission, principal
 
 User = Blueprint('User', __name__, url_prefix='/user')
 
@@ -33,10 +32,6 @@ def login_get():
 @zvms_route(User, url.login)
 def login_post(userident: str, password: str):
     info = UserKernel.login(userident, md5(password.encode()))
-    session.update(dict(zip(
-        ('userid', 'username', 'permission', 'classid'),
-        info
-    )))
     return redirect(request.args.get('redirect_to', f'/user/{info[0]}'))
 
 
@@ -49,8 +44,7 @@ def logout():
 @zvms_route(User, url['userid'], 'GET')
 @login_required
 def user_info(userid: int):
-    manager = int(session.get('permission')) & (
-        Permission.MANAGER | Permission.ADMIN)
+    manager = Permission.MANAGER.authorized()
     username, permission, classid, class_name = UserKernel.user_info(userid)
     notices = NoticeKernel.my_notices()
     return render_template(
@@ -61,7 +55,7 @@ def user_info(userid: int):
         classid=classid,
         class_name=class_name,
         scores=UserKernel.get_time_sums(userid),
-        is_self=userid == session.get('userid'),
+        is_self=userid == principal.userid,
         notices=[
             (i, title, render_markdown(content), *spam)
             for i, (title, content, *spam) in enumerate(notices)
@@ -82,7 +76,7 @@ def modify_password(target: int, old: str, new: str):
 def class_list():
     return render_template(
         'zvms/class_list.html',
-        classes=execute_sql('SELECT id, name FROM class').fetchall()
+        classes=UserKernel.get_classes()
     )
 
 
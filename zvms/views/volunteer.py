@@ -27,7 +27,13 @@ from ..misc import (
     Permission,
     VolStatus,
     VolKind,
-    VolType
+    VolType,
+    principal
+)
+from ..cache import (
+    fragments,
+    VOLUNTEER,
+    THOUGHT
 )
 from ..kernel import volunteer as VolKernel
 from ..kernel.volunteer import SelectResult
@@ -35,10 +41,10 @@ from ..kernel.volunteer import SelectResult
 Volunteer = Blueprint('Volunteer', __name__, url_prefix='/volunteer')
 
 
-def select_volunteers(result: SelectResult, page: int, base_url: str) -> str:
-    total, data = result
+def _render_volunteers(select: Callable[[], SelectResult], page: int, base_url: str) -> str:
+    total, data = select()
     return render_template(
-        'zvms/volunteer/list.html',
+        'zvms/volunteer/list_items.html',
         data=[
             (
                 id,
@@ -57,11 +63,32 @@ def select_volunteers(result: SelectResult, page: int, base_url: str) -> str:
     )
 
 
+def select_volunteers(
+    select: Callable[[], SelectResult],
+    page: int,
+    base_url: str,
+    *key,
+    depends: tuple[str, ...] = (VOLUNTEER,)
+) -> str:
+    """
+    列表部分按(base_url, page, *key)缓存, key为影响查询结果的其他输入(如用户ID);
+    缓存命中时不执行select
+    """
+    return render_template(
+        'zvms/volunteer/list.html',
+        fragment=fragments.get(
+            (base_url, page, *key),
+            depends,
+            partial(_render_volunteers, select, page, base_url)
+        )
+    )
+
+
 @zvms_route(Volunteer, url.search, 'GET')
 @login_required
 def search_volunteers(name: str, page: int = 0):
     return select_volunteers(
-        VolKernel.search_volunteers(name, page),
+        partial(VolKernel.search_volunteers, name, page),
         page,
         f'/volunteer/search?name={quote(name)}&'
     )
@@ -71,7 +98,7 @@ def search_volunteers(name: str, page: int = 0):
 @login_required
 def list_volunteers(page: int = 0):
     return select_volunteers(
-        VolKernel.list_volunteers(page),
+        partial(VolKernel.list_volunteers, page),
         page,
         '/volunteer/list'
     )
@@ -81,9 +108,13 @@ def list_volunteers(page: int = 0):
 @login_required
 def my_volunteers(page: int = 0):
     return select_volunteers(
-        VolKernel.my_volunteers(page),
+        partial(VolKernel.my_volunteers, page),
         page,
-        '/volunteer/me'
+        '/volunteer/me',
+        principal.userid,
+        principal.classid,
+        Permission.CLASS.authorized(),
+        depends=(VOLUNTEER, THOUGHT)
     )
 
 